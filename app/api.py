@@ -1,7 +1,10 @@
 # api.py
+import json
 import os
+import time
 from dotenv import load_dotenv
 from openai import OpenAI
+from cassette import Cassette
 
 # Load environment variables from .env file
 load_dotenv()
@@ -12,17 +15,58 @@ project_id = os.getenv("OPENAI_PROJECT_ID")
 organization_id = os.getenv("OPENAI_ORG")
 model = os.getenv("MODEL", "gpt-4o")
 api_key = os.getenv("OPENAI_API_KEY")
+latency_log = os.getenv("LATENCY_LOG")  # Optional JSONL of request timings for the planner
 
-# Validate that the API key is provided
-if not api_key:
+# Optional record/replay of API requests (CASSETTE_MODE=record or replay)
+cassette = Cassette.from_env()
+replaying = cassette is not None and cassette.replaying
+
+# Validate that the API key is provided; replayed runs never reach the network
+if not api_key and not replaying:
     raise ValueError("OPENAI_API_KEY is required but not found in environment variables")
 
 # Instantiate the OpenAI API client with the given API key and configuration
-client = OpenAI(
-    api_key=api_key,
-    organization=organization_id,
-    project=project_id,
-)
+client = None
+if not replaying:
+    client = OpenAI(
+        api_key=api_key,
+        organization=organization_id,
+        project=project_id,
+    )
+
+
+def log_latency(seconds, usage):
+    """Append one request's timing and token usage to LATENCY_LOG."""
+    if not latency_log or usage is None:
+        return
+    entry = {
+        "model": model,
+        "input_tokens": usage.prompt_tokens,
+        "output_tokens": usage.completion_tokens,
+        "seconds": round(seconds, 3),
+    }
+    with open(latency_log, "a", encoding="utf-8") as log_file:
+        log_file.write(json.dumps(entry) + "\n")
+
+
+def request_completion(system_message, user_message, start):
+    """Call the chat completions API and return the content of the first choice."""
+    # Call the chat.completions API of OpenAI with essential parameters
+    completion = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": system_message},  # System message
+            {"role": "user", "content": user_message},  # User message
+        ],
+        max_tokens=3072,  # Maximum number of tokens in the generated message
+        temperature=0.5,  # Adding temperature parameter
+    )
+    log_latency(time.monotonic() - start, getattr(completion, "usage", None))
+
+    # Check if choices and message are available in the response
+    if completion.choices and completion.choices[0].message:
+        return completion.choices[0].message.content
+    raise Exception("Unexpected response format from OpenAI")
 
 
 def communicate_with_openai(
@@ -38,24 +82,26 @@ def communicate_with_openai(
             f"\n\nSending to OpenAI API:\n\n{section_text}\n\nCompleted Sections: {completed_sections}/{total_sections}"
         )
 
-        # Call the chat.completions API of OpenAI with essential parameters
-        completion = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system_message},  # System message
-                {"role": "user", "content": user_message},  # User message
-            ],
-            max_tokens=3072,  # Maximum number of tokens in the generated message
-            temperature=0.5,  # Adding temperature parameter
-        )
-
-        # Check if choices and message are available in the response
-        if completion.choices and completion.choices[0].message:
-            # Print only the content of the first message in choices
-            print(f"API Response Content:\n{completion.choices[0].message.content}")
-            return completion.choices[0].message.content
+        if replaying:
+            content = cassette.replay(model, system_message, user_message)
         else:
-            raise Exception("Unexpected response format from OpenAI")
+            start = time.monotonic()
+            try:
+                content = request_completion(system_message, user_message, start)
+            except Exception as e:
+                if cassette is not None:
+                    cassette.record(
+                        model, system_message, user_message, time.monotonic() - start, error=str(e)
+                    )
+                raise
+            if cassette is not None:
+                cassette.record(
+                    model, system_message, user_message, time.monotonic() - start, content
+                )
+
+        # Print only the content of the first message in choices
+        print(f"API Response Content:\n{content}")
+        return content
 
     except Exception as e:
         # If any error, raise it with proper information.
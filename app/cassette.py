@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+CASSETTE_MODES = ["off", "record", "replay"]
+DEFAULT_CASSETTE_PATH = "cassettes/api.jsonl"
+
+
+def request_key(model, system_message, user_message):
+    """Return the key a request is recorded and replayed under."""
+    return hashlib.sha256(
+        json.dumps([model, system_message, user_message]).encode("utf-8")
+    ).hexdigest()
+
+
+class Cassette:
+    """Records API request/response pairs with their timings, or replays them.
+
+    A cassette is a JSONL file with one entry per request. When replaying,
+    entries for the same request are returned in recorded order, the last one
+    repeating once they run out, and each reply waits its recorded latency
+    divided by speed (0 for no delay). failure_rate injects errors into a
+    fraction of replies, drawn from a seeded generator so runs are repeatable.
+    The cassette file is read on the first replayed request, so a missing
+    file only fails runs that actually call the API.
+    """
+
+    def __init__(self, path, mode, speed=1.0, failure_rate=0.0, seed=0):
+        if mode not in ["record", "replay"]:
+            raise ValueError(f"Cassette mode must be 'record' or 'replay', not '{mode}'.")
+        self.path = path
+        self.mode = mode
+        self.speed = speed
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.entries = defaultdict(list)
+        self.positions = defaultdict(int)
+        self.loaded = False
+
+    @classmethod
+    def from_env(cls):
+        """Return the cassette configured by CASSETTE_MODE, or None when it is off."""
+        mode = os.getenv("CASSETTE_MODE", "off")
+        if mode == "off":
+            return None
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"CASSETTE_MODE must be one of {', '.join(CASSETTE_MODES)}.")
+        return cls(
+            os.getenv("CASSETTE_PATH", DEFAULT_CASSETTE_PATH),
+            mode,
+            float(os.getenv("CASSETTE_SPEED", 1.0)),
+            float(os.getenv("CASSETTE_FAILURE_RATE", 0.0)),
+            int(os.getenv("CASSETTE_SEED", 0)),
+        )
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette {self.path} does not exist.")
+        with open(self.path, "r", encoding="utf-8") as cassette_file:
+            for line in cassette_file:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry["key"]].append(entry)
+        self.loaded = True
+
+    def record(self, model, system_message, user_message, seconds, response=None, error=None):
+        """Append one request with its response or error and its latency."""
+        entry = {
+            "key": request_key(model, system_message, user_message),
+            "model": model,
+            "system": system_message,
+            "user": user_message,
+            "response": response,
+            "error": error,
+            "seconds": round(seconds, 3),
+        }
+        with self.lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.path, "a", encoding="utf-8") as cassette_file:
+                cassette_file.write(json.dumps(entry) + "\n")
+
+    def replay(self, model, system_message, user_message):
+        """Return the recorded response for a request, raising recorded or injected errors."""
+        key = request_key(model, system_message, user_message)
+        with self.lock:
+            if not self.loaded:
+                self._load()
+            entries = self.entries.get(key)
+            if not entries:
+                raise Exception(f"No cassette entry for request {key[:12]} in {self.path}")
+            entry = entries[min(self.positions[key], len(entries) - 1)]
+            self.positions[key] += 1
+            inject_failure = self.random.random() < self.failure_rate
+
+        if self.speed > 0:
+            time.sleep(entry["seconds"] / self.speed)
+        if inject_failure:
+            raise Exception("Injected cassette failure")
+        if entry.get("error"):
+            raise Exception(entry["error"])
+        return entry["response"]
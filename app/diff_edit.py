@@ -0,0 +1,87 @@
+import json
+import re
+
+# Instructions appended to the system message when the model is asked for a
+# compact list of replacements instead of the full corrected section.
+DIFF_SYSTEM_SUFFIX = (
+    " Instead of returning the corrected text, return only a JSON object of the form "
+    '{"edits": [{"paragraph": <index>, "old": "<exact text to replace>", "new": "<replacement text>"}]}. '
+    "Paragraph indexes are the numbers before each line of the input. "
+    "Keep each \"old\" span as short as possible while still unique within its paragraph, "
+    "copy it exactly from the input, and never include the leading paragraph number. "
+    'If the text needs no changes, return {"edits": []}. Output JSON only, with no comments before or after.'
+)
+DIFF_USER_PREFIX = "List the minimal replacements needed to correct the following numbered paragraphs"
+
+JSON_FENCE_REGEX = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL | re.IGNORECASE)
+WRAPPER_TAG_REGEX = re.compile(r"^<([a-z0-9]+)>.*</\1>$", re.IGNORECASE | re.DOTALL)
+
+
+def number_paragraphs(section_text):
+    """Prefix each line of a section with its paragraph index."""
+    return "\n".join(
+        f"{index}: {line}" for index, line in enumerate(section_text.split("\n"))
+    )
+
+
+def parse_replacements(response_text):
+    """Parse the model's JSON response into a list of (index, old, new) tuples."""
+    text = response_text.strip()
+    fence_match = JSON_FENCE_REGEX.match(text)
+    if fence_match:
+        text = fence_match.group(1)
+
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Response is not valid JSON: {e}") from e
+
+    edits = payload.get("edits") if isinstance(payload, dict) else payload
+    if not isinstance(edits, list):
+        raise ValueError("Response does not contain an edits list")
+
+    replacements = []
+    for edit in edits:
+        if not isinstance(edit, dict):
+            raise ValueError(f"Malformed edit entry: {edit!r}")
+        index = edit.get("paragraph")
+        old = edit.get("old")
+        new = edit.get("new")
+        if isinstance(index, bool) or not isinstance(index, int):
+            raise ValueError(f"Edit has an invalid paragraph index: {edit!r}")
+        if not isinstance(old, str) or not old or not isinstance(new, str):
+            raise ValueError(f"Edit has invalid old/new spans: {edit!r}")
+        replacements.append((index, old, new))
+
+    return replacements
+
+
+def apply_replacements(section_text, replacements):
+    """Apply replacements to a section, validating every span against the source.
+
+    Raises ValueError if an edit points outside the section, its old span does not
+    occur exactly once in the target paragraph, or it would break the paragraph's
+    wrapper tag.
+    """
+    lines = section_text.split("\n")
+
+    for index, old, new in replacements:
+        if index < 0 or index >= len(lines):
+            raise ValueError(f"Paragraph index {index} is out of range")
+        if old not in lines[index]:
+            raise ValueError(f"Span {old!r} not found in paragraph {index}")
+        # An ambiguous span could land on the wrong occurrence
+        if lines[index].count(old) > 1:
+            raise ValueError(f"Span {old!r} is not unique in paragraph {index}")
+        lines[index] = lines[index].replace(old, new, 1)
+
+    original_lines = section_text.split("\n")
+    for index, (before, after) in enumerate(zip(original_lines, lines)):
+        before_match = WRAPPER_TAG_REGEX.match(before.strip())
+        if not before_match:
+            continue
+        after_match = WRAPPER_TAG_REGEX.match(after.strip())
+        if not after_match or after_match.group(1).lower() != before_match.group(1).lower():
+            raise ValueError(f"Edit breaks the wrapper tag of paragraph {index}")
+
+    return "\n".join(lines)
@@ -1,16 +1,58 @@
+import copy
 import os
 import re
+import shutil
 from docx.shared import Inches
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml.ns import qn
+from docx.text.run import Run
 from dotenv import load_dotenv
 from api import communicate_with_openai
+from formats import (
+    CHAPTER_TAG,
+    INLINE_TAG_REGEX,
+    OUTPUT_EXTENSIONS,
+    TAG_SHAPED_REGEX,
+    default_output_format,
+    input_format,
+    parse_line,
+    read_lines,
+    write_lines,
+)
+from journal import file_hash, open_journal, text_hash
+from diff_edit import (
+    DIFF_SYSTEM_SUFFIX,
+    DIFF_USER_PREFIX,
+    apply_replacements,
+    number_paragraphs,
+    parse_replacements,
+)
+from prepass import prepass_section
+from section_store import PackedStore, open_section_store
+from style_channel import (
+    INLINE_PROPERTY_TAGS,
+    OBJECT_TAG_REGEX,
+    RUN_TAG_REGEX,
+    SIDE_CHANNEL_FILENAME,
+    StyleRestorer,
+    base_run_properties,
+    extra_run_properties,
+    is_object_run,
+    load_side_channel,
+    new_side_channel,
+    record,
+    save_side_channel,
+    serialize,
+)
 
 # Pre-compile regular expressions for better performance
 HEADER_LEVEL_REGEX = re.compile(r"\d+")
 HEADING_TAG_REGEX = re.compile(
     r"<h(?P<level>[1-9])>(.*?)</h(?P=level)>", re.IGNORECASE
 )
+CHAPTER_TAG_REGEX = re.compile(rf"<{CHAPTER_TAG}>.*</{CHAPTER_TAG}>", re.IGNORECASE | re.DOTALL)
+LINE_TAG_REGEX = re.compile(r"<(?P<tag>[a-z0-9]+)>(.*)</(?P=tag)>", re.IGNORECASE | re.DOTALL)
 
 # Load the environment variables
 load_dotenv()
@@ -61,7 +103,12 @@ def replace_quotes(text):
 
 
 def process_html_fragments(line_content):
-    """Process HTML content and return fragments with styles."""
+    """Process HTML content and return fragments with styles.
+
+    Only the inline tags of the section format (<b>, <i>, <rN> and <xN/>) are
+    applied. Other tag-shaped text, such as a stray <em> or <br>, is dropped,
+    and any other "<" is kept as text.
+    """
     fragments = []
     current_text = []
     style_stack = []
@@ -83,7 +130,12 @@ def process_html_fragments(line_content):
             is_closing = tag_content.startswith("/")
             tag_name = tag_content[1:] if is_closing else tag_content
 
-            if tag_name in {"b", "i"}:
+            object_match = OBJECT_TAG_REGEX.fullmatch(tag_name)
+            if object_match:
+                # Opaque side-channel runs become their own empty fragment
+                append_fragment()
+                fragments.append(("", {f"x{object_match.group(1)}"}))
+            elif tag_name in {"b", "i"} or RUN_TAG_REGEX.fullmatch(tag_name):
                 append_fragment()
                 if is_closing:
                     for idx in range(len(style_stack) - 1, -1, -1):
@@ -92,6 +144,11 @@ def process_html_fragments(line_content):
                             break
                 else:
                     style_stack.append(tag_name)
+            elif not TAG_SHAPED_REGEX.fullmatch(line_content, i, end_idx + 1):
+                # Not a tag at all, such as "A < B and C > D"
+                current_text.append("<")
+                i += 1
+                continue
 
             i = end_idx + 1
         else:
@@ -102,88 +159,198 @@ def process_html_fragments(line_content):
     return fragments
 
 
-def add_formatted_runs(para, fragments):
-    """Add formatted runs to a paragraph based on fragments."""
+def add_formatted_runs(para, fragments, restorer=None, key=None, curl_quotes=True):
+    """Add formatted runs to a paragraph based on fragments.
+
+    With a StyleRestorer, <rN> runs get their side-channel properties, other runs
+    get the source paragraph's base run properties, and <xN/> objects are cloned.
+    curl_quotes False keeps the fragments' quotes as written.
+    """
     for fragment, styles in fragments:
-        text = replace_quotes(fragment)
+        placeholders = sorted(style for style in styles if style not in {"b", "i"})
+        objects = [style[1:] for style in placeholders if style.startswith("x")]
+        if objects:
+            if restorer is not None:
+                restorer.add_object(para, objects[0])
+            continue
+
+        text = replace_quotes(fragment) if curl_quotes else fragment
         run = para.add_run(text)
         if 'b' in styles:
             run.bold = True
         if 'i' in styles:
             run.italic = True
-
-
-def split_into_sections(filename, section_size):
+        if restorer is not None:
+            # The innermost placeholder wins when they are nested
+            run_numbers = [style[1:] for style in placeholders if style.startswith("r")]
+            if run_numbers:
+                restorer.apply_run(run, number=run_numbers[-1])
+            else:
+                restorer.apply_run(run, key=key)
+
+
+def paragraph_to_html(paragraph, side_channel=None):
+    """Convert a DOCX paragraph into its tagged section line.
+
+    With a side-channel, runs whose formatting differs from the paragraph's base
+    run formatting are wrapped in <rN> placeholders and opaque runs become <xN/>,
+    with the original XML recorded under N.
+    """
+    styled_text = ""
+    base_properties = None
+    if side_channel is not None:
+        base_properties = base_run_properties(paragraph.runs)
+
+    for run in paragraph.runs:
+        if side_channel is not None and is_object_run(run):
+            styled_text += f"<x{record(side_channel, 'objects', serialize(run._r))}/>"
+            continue
+
+        run_text = run.text
+        if run.bold and run.italic:
+            run_text = f"<b><i>{run_text}</i></b>"
+        elif run.bold:
+            run_text = f"<b>{run_text}</b>"
+        elif run.italic:
+            run_text = f"<i>{run_text}</i>"
+
+        if side_channel is not None:
+            properties = extra_run_properties(run)
+            if properties != base_properties:
+                number = record(side_channel, "runs", properties or "")
+                run_text = f"<r{number}>{run_text}</r{number}>"
+        styled_text += run_text
+
+    if paragraph.style.name == "Title":
+        return f"<title>{styled_text}</title>"
+    if paragraph.style.name.startswith("Heading"):
+        matches = HEADER_LEVEL_REGEX.findall(paragraph.style.name)
+        if matches:
+            header_level = matches[0]
+            return f"<h{header_level}>{styled_text}</h{header_level}>"
+        return f"<p>{styled_text}</p>"
+    try:
+        if paragraph.alignment == WD_ALIGN_PARAGRAPH.CENTER:
+            return f"<center>{styled_text}</center>"
+    except Exception:
+        pass
+    return f"<p>{styled_text}</p>"
+
+
+def iter_paragraph_lines(filename, side_channel=None):
+    """Yield (tagged line, DOCX paragraph or None) for each paragraph of an input file."""
+    if input_format(filename) != "docx":
+        for line in read_lines(filename):
+            yield line, None
+        return
+
+    doc = Document(filename)
+    for paragraph in doc.paragraphs:
+        if not paragraph.runs:  # Check if paragraph is empty
+            continue
+        yield paragraph_to_html(paragraph, side_channel), paragraph
+
+
+def iter_sections(filename, section_size, side_channel=None):
+    """Yield the sections of an input file as lists of tagged lines, each as soon as it is sealed.
+
+    DOCX files are parsed with python-docx; EPUB, Markdown and plain text
+    files go through their readers in app/formats.py. With a side-channel,
+    each DOCX paragraph's properties are recorded under its "section:line"
+    key before its section is yielded.
+    """
+    return group_sections(iter_paragraph_lines(filename, side_channel), section_size, side_channel)
+
+
+def group_sections(paragraph_lines, section_size, side_channel=None):
+    """Group (tagged line, DOCX paragraph or None) pairs into sections of about section_size words.
+
+    Callers comparing several section sizes can read the paragraph lines once
+    and group them again for each size.
+    """
+    current_section = []
+    current_tokens = 0
+    section_number = 1
+
+    for styled_text, paragraph in paragraph_lines:
+
+        new_tokens = len(styled_text.split())
+        if current_tokens + new_tokens > section_size and current_section:
+            yield current_section
+            current_section = []
+            current_tokens = 0
+            section_number += 1
+
+        if side_channel is not None and paragraph is not None:
+            pPr = paragraph._p.pPr
+            side_channel["paragraphs"][f"{section_number}:{len(current_section)}"] = {
+                "pPr": serialize(pPr) if pPr is not None else None,
+                "rPr": base_run_properties(paragraph.runs),
+            }
+
+        current_section.append(styled_text)
+        current_tokens += new_tokens
+
+        # Seal oversized single-paragraph sections immediately so they
+        # each get their own section without splitting the paragraph.
+        if new_tokens > section_size:
+            yield current_section
+            current_section = []
+            current_tokens = 0
+            section_number += 1
+
+    if current_section:
+        yield current_section
+
+
+def split_into_sections(filename, section_size, keep_styles=False):
+    """Load a DOCX file, split it into sections, and create .old files.
+
+    With keep_styles, paragraph and run properties are saved to a local
+    side-channel that merge_groups_and_save uses to restore them. Only DOCX
+    input has such properties, so keep_styles is ignored for other formats.
+    """
+    keep_styles = keep_styles and input_format(filename) == "docx"
     file = os.path.splitext(os.path.basename(filename))[0]
     # Create a directory with the name './tmp/{file}'
     tmp_dir = f"./tmp/{file}"
     if not os.path.exists(tmp_dir):
         os.makedirs(tmp_dir)
-    """Load a DOCX file, split it into sections, and create .old files."""
     try:
-        doc = Document(filename)
-        sections = []
-        current_section = []
-        current_tokens = 0
-
-        for paragraph in doc.paragraphs:
-            runs = paragraph.runs
-            if not runs:  # Check if paragraph is empty
-                continue
-
-            styled_text = ""
-            for run in runs:
-                run_text = run.text
-                if run.bold and run.italic:
-                    run_text = f"<b><i>{run_text}</i></b>"
-                elif run.bold:
-                    run_text = f"<b>{run_text}</b>"
-                elif run.italic:
-                    run_text = f"<i>{run_text}</i>"
-                styled_text += run_text
-
-            if paragraph.style.name == "Title":
-                styled_text = f"<title>{styled_text}</title>"
-            elif paragraph.style.name.startswith("Heading"):
-                matches = HEADER_LEVEL_REGEX.findall(paragraph.style.name)
-                if matches:
-                    header_level = matches[0]
-                    styled_text = f"<h{header_level}>{styled_text}</h{header_level}>"
-                else:
-                    styled_text = f"<p>{styled_text}</p>"
-            else:
-                try:
-                    if paragraph.alignment == WD_ALIGN_PARAGRAPH.CENTER:
-                        styled_text = f"<center>{styled_text}</center>"
-                    else:
-                        styled_text = f"<p>{styled_text}</p>"
-                except Exception:
-                    styled_text = f"<p>{styled_text}</p>"
-
-            new_tokens = len(styled_text.split())
-            if current_tokens + new_tokens > section_size and current_section:
-                sections.append(current_section)
-                current_section = []
-                current_tokens = 0
-
-            current_section.append(styled_text)
-            current_tokens += new_tokens
-
-            # Seal oversized single-paragraph sections immediately so they
-            # each get their own section without splitting the paragraph.
-            if new_tokens > section_size:
-                sections.append(current_section)
-                current_section = []
-                current_tokens = 0
-
-        if current_section:
-            sections.append(current_section)
-
-        # Create .old files for each section
-        for i, section in enumerate(sections, start=1):
-            old_filename = os.path.join(tmp_dir, f"{i}-section.old")
-            with open(old_filename, "w") as file:
-                file.write("\n".join(section))
+        side_channel = new_side_channel() if keep_styles else None
+        sections = list(iter_sections(filename, section_size, side_channel))
+
+        # Keep the side-channel in step with this split's section boundaries
+        if side_channel is not None:
+            save_side_channel(tmp_dir, side_channel)
+        elif os.path.exists(os.path.join(tmp_dir, SIDE_CHANNEL_FILENAME)):
+            os.remove(os.path.join(tmp_dir, SIDE_CHANNEL_FILENAME))
+
+        store = open_section_store(tmp_dir)
+        try:
+            journal = open_journal(tmp_dir, store)
+            input_hash = file_hash(filename)
+            if journal.same_split(input_hash, section_size, keep_styles):
+                print("[split_into_sections] Input and split parameters unchanged since last split")
+
+            # Store the .old text for each section, leaving unchanged sections alone
+            section_hashes = []
+            for i, section in enumerate(sections, start=1):
+                section_text = "\n".join(section)
+                section_hashes.append(text_hash(section_text))
+                if store.exists(i, "old") and store.read(i, "old") == section_text:
+                    continue
+                store.write(i, "old", section_text)
+
+            # Drop sections left over from an earlier split into more sections
+            for kind in ["old", "new"]:
+                for number in store.numbers(kind):
+                    if number > len(sections):
+                        store.delete(number, kind)
+
+            journal.record_split(input_hash, section_size, keep_styles, section_hashes)
+        finally:
+            store.close()
 
         return sections
 
@@ -191,7 +358,120 @@ def split_into_sections(filename, section_size):
         raise Exception(f"Error processing document: {e}")
 
 
-def process_manuscript(filename, system_message, user_prefix):
+def request_section_edit(
+    section_text, completed_sections, total_sections, system_message, user_prefix, diff_mode=False
+):
+    """Send a section to the API and return its corrected text.
+
+    In diff mode the model returns a compact list of replacements which is applied
+    locally; invalid or unusable replacement lists fall back to a full-text request.
+    """
+    if diff_mode:
+        response = communicate_with_openai(
+            number_paragraphs(section_text),
+            completed_sections,
+            total_sections,
+            system_message + DIFF_SYSTEM_SUFFIX,
+            DIFF_USER_PREFIX,
+        )
+        try:
+            replacements = parse_replacements(response)
+            if not replacements:
+                print("[process_manuscript] No edits needed; reusing original section text.")
+                return section_text
+            corrected_text = apply_replacements(section_text, replacements)
+            print(f"[process_manuscript] Applied {len(replacements)} replacements locally.")
+            return corrected_text
+        except ValueError as e:
+            print(f"[process_manuscript] Invalid diff response ({e}); falling back to full text.")
+
+    corrected_text = communicate_with_openai(
+        section_text,
+        completed_sections,
+        total_sections,
+        system_message,
+        user_prefix,
+    )
+    if corrected_text.strip() == section_text.strip():
+        print("[process_manuscript] Model returned the section unchanged.")
+    return corrected_text
+
+
+def process_section(
+    store,
+    number,
+    completed_sections,
+    total_sections,
+    system_message,
+    user_prefix,
+    diff_mode=False,
+    prepass=False,
+    journal=None,
+    prompt_hash=None,
+):
+    """Correct one stored .old section and store the result as its .new section.
+
+    With a journal, the attempt is recorded before the request and committed
+    once the .new section is stored, under the compiled prompt's hash.
+    """
+    section_text = old_text = store.read(number, "old")
+    if journal is not None:
+        journal.begin(number, old_text, prompt_hash)
+    print(f"[process_manuscript] Section text length: {len(section_text)}")
+
+    needs_model = True
+    if prepass:
+        section_text, fixes, needs_model = prepass_section(section_text)
+        print(f"[process_manuscript] Pre-pass fixes: {fixes}, needs model: {needs_model}")
+
+    if needs_model:
+        corrected_text = request_section_edit(
+            section_text,
+            completed_sections,
+            total_sections,
+            system_message,
+            user_prefix,
+            diff_mode,
+        )
+    else:
+        corrected_text = section_text
+
+    # Print the corrected text before writing to file
+    print(f"[process_manuscript] Response From API:\n{corrected_text}")
+
+    store.write(number, "new", corrected_text)
+    if journal is not None:
+        journal.commit(number, old_text, corrected_text, prompt_hash)
+    return corrected_text
+
+
+def has_valid_new(store, journal, number, prompt_hash=None):
+    """Return True if a section's stored .new output is committed for its current .old text.
+
+    With a prompt hash the commit must also be for that prompt.
+    """
+    if not store.exists(number, "new"):
+        return False
+    if journal.is_valid(number, store.read(number, "old"), store.read(number, "new"), prompt_hash):
+        return True
+    print(f"[process_manuscript] .new section {number} does not match the journal")
+    return False
+
+
+def process_manuscript(
+    filename,
+    system_message,
+    user_prefix,
+    diff_mode=False,
+    prepass=False,
+    progress=None,
+    prompt_hash=None,
+):
+    """Process every .old section that has no reusable .new section.
+
+    prompt_hash is the compiled prompt's hash; a .new section is only reused if
+    the journal committed it for that prompt. Without one, any prompt matches.
+    """
     file = os.path.splitext(os.path.basename(filename))[0]
     print(f"[process_manuscript] Starting processing for: {filename}")
     try:
@@ -203,69 +483,68 @@ def process_manuscript(filename, system_message, user_prefix):
             print(f"[process_manuscript] Temporary directory not found: {tmp_dir}")
             raise Exception("Temporary directory not found.")
 
-        # Get a list of all .old files and sort them based on their numeric prefixes
-        old_files = sorted(
-            [f for f in os.listdir(tmp_dir) if f.endswith(".old")],
-            key=lambda x: int(x.split("-")[0]),
-        )
-        print(f"[process_manuscript] Found {len(old_files)} .old files in {tmp_dir}")
+        store = open_section_store(tmp_dir)
+        journal = open_journal(tmp_dir, store)
+
+        # Get the section numbers of all stored .old sections in order
+        old_numbers = store.numbers("old")
+        print(f"[process_manuscript] Found {len(old_numbers)} .old sections in {tmp_dir}")
 
         # Initialize corrected sections list
         corrected_sections = []
 
-        # Count the number of '.old' files in the './tmp' directory
-        total_sections = len(old_files)
-
-        # Build a set of stems (filename without extension) for current .old files
-        old_stems = {os.path.splitext(f)[0] for f in old_files}
+        # Count the number of '.old' sections
+        total_sections = len(old_numbers)
 
-        # Initialize completed_sections from any pre-existing .new files that
-        # correspond to the current set of .old files, so that resume (re-run
-        # after partial completion) works correctly even if there are stale .new files.
-        completed_sections = sum(
-            1
-            for f in os.listdir(tmp_dir)
-            if f.endswith(".new") and os.path.splitext(f)[0] in old_stems
-        )
+        # Initialize completed_sections from the pre-existing .new sections the
+        # journal confirms for the current .old sections, so that resume (re-run
+        # after partial completion) skips them and redoes torn or stale ones.
+        reusable = {
+            number for number in old_numbers if has_valid_new(store, journal, number, prompt_hash)
+        }
+        completed_sections = len(reusable)
         # Ensure progress count never exceeds the total number of sections
         completed_sections = min(completed_sections, total_sections)
 
-        # Process each .old file
-        for old_file in old_files:
-            print(f"[process_manuscript] Processing section file: {old_file}")
-            new_filename = os.path.join(tmp_dir, old_file.replace(".old", ".new"))
-
-            # Process only if .new file does not exist
-            if not os.path.exists(new_filename):
-                with open(os.path.join(tmp_dir, old_file), "r") as section_file:
-                    section_text = section_file.read()
-                print(f"[process_manuscript] Section text length: {len(section_text)}")
+        # Process each .old section
+        for number in old_numbers:
+            print(f"[process_manuscript] Processing section: {number}-section.old")
 
-                corrected_text = communicate_with_openai(
-                    section_text,
+            # Process only if there is no valid .new section
+            if number not in reusable:
+                corrected_text = process_section(
+                    store,
+                    number,
                     completed_sections,
                     total_sections,
                     system_message,
                     user_prefix,
+                    diff_mode,
+                    prepass,
+                    journal,
+                    prompt_hash,
                 )
 
-                # Print the corrected text before writing to file
-                print(f"[process_manuscript] Response From API:\n{corrected_text}")
-
-                with open(new_filename, "w") as new_section_file:
-                    new_section_file.write(corrected_text)
-
                 # Increment completed_sections for progress tracking, but do not
                 # allow it to exceed total_sections.
                 completed_sections = min(completed_sections + 1, total_sections)
+                if progress is not None:
+                    progress(
+                        {
+                            "event": "section",
+                            "section": number,
+                            "completed": completed_sections,
+                            "total": total_sections,
+                        }
+                    )
 
             else:
-                print(f"[process_manuscript] .new file already exists for section: {old_file}")
-                with open(new_filename, "r") as new_section_file:
-                    corrected_text = new_section_file.read()
+                print(f"[process_manuscript] .new section already exists for section: {number}")
+                corrected_text = store.read(number, "new")
 
             corrected_sections.append(corrected_text)
 
+        store.close()
         print("Finished processing all sections.")
         return corrected_sections
 
@@ -280,98 +559,407 @@ def cleanup_temp_files(filename):
     tmp_dir = f"./tmp/{file}"
 
     if os.path.exists(tmp_dir):
-        import shutil
         shutil.rmtree(tmp_dir)
         print(f"Cleaned up temporary directory: {tmp_dir}")
 
 
-def merge_groups_and_save(filename, action):
+def export_section_store(filename):
+    """Export a packed section store to the N-section.old/.new file layout."""
     file = os.path.splitext(os.path.basename(filename))[0]
+    store = PackedStore(f"./tmp/{file}")
+    try:
+        count = store.export_files()
+    finally:
+        store.close()
+    print(f"Exported {count} sections to ./tmp/{file}")
+    return count
+
+
+def import_section_store(filename):
+    """Import N-section.old/.new files into a packed section store."""
+    file = os.path.splitext(os.path.basename(filename))[0]
+    store = PackedStore(f"./tmp/{file}")
+    try:
+        count = store.import_files()
+    finally:
+        store.close()
+    print(f"Imported {count} sections into ./tmp/{file}")
+    return count
+
+
+def add_section_line(doc, line, seen_h1_heading=False, restorer=None, key=None):
+    """Add one tagged line to a document and return (paragraph, seen_h1_heading)."""
+    if line.startswith("<title>") and line.endswith("</title>"):
+        line_content = replace_quotes(line[7:-8])
+        para = doc.add_heading(line_content, level=1)
+        para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        return para, seen_h1_heading
+
+    heading_match = HEADING_TAG_REGEX.fullmatch(line)
+    if heading_match:
+        heading_level = int(heading_match.group("level"))
+        heading_content = heading_match.group(2)
+
+        if heading_level == 1:
+            if seen_h1_heading:
+                doc.add_page_break()
+            else:
+                seen_h1_heading = True
+
+        para = doc.add_heading("", level=heading_level)
+        if heading_level == 1:
+            para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+        fragments = process_html_fragments(heading_content)
+        if fragments:
+            if para.runs:
+                for run in para.runs:
+                    run.text = ""
+            add_formatted_runs(para, fragments, restorer, key)
+        else:
+            para.text = replace_quotes(heading_content)
+        return para, seen_h1_heading
+
+    if line.startswith("<center>") and line.endswith("</center>"):
+        line_content = line[8:-9]
+        para = doc.add_paragraph()
+        para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        fragments = process_html_fragments(line_content)
+        add_formatted_runs(para, fragments, restorer, key)
+        return para, seen_h1_heading
+
+    if line.startswith("<p>") and line.endswith("</p>"):
+        line_content = line[3:-4]
+        para = doc.add_paragraph()
+        para.paragraph_format.first_line_indent = Inches(0.20)
+        fragments = process_html_fragments(line_content)
+        add_formatted_runs(para, fragments, restorer, key)
+        return para, seen_h1_heading
+
+    return None, seen_h1_heading
+
+
+def append_section_lines(
+    doc, lines, seen_h1_heading=False, restorer=None, section=None, first_line=0
+):
+    """Append a section's tagged lines to a document.
+
+    Returns whether an <h1> heading has been seen so far, so callers building a
+    document section by section can keep page breaks between chapters. With a
+    StyleRestorer, run placeholders are restored, and when a section number is
+    given each paragraph also gets the source properties of the same line.
+    first_line is the position of the first given line within its section.
+    """
+    lines = [line.strip() for line in lines if line.strip()]
+    for index, line in enumerate(lines, start=first_line):
+        key = f"{section}:{index}" if section is not None else None
+        para, seen_h1_heading = add_section_line(doc, line, seen_h1_heading, restorer, key)
+        if para is not None and restorer is not None and key is not None:
+            restorer.apply_paragraph(para, key)
+
+    return seen_h1_heading
+
+
+def styled_section(store, number, lines):
+    """Return the section number if its lines still map one-to-one onto the .old lines."""
+    old_lines = [line for line in store.read(number, "old").splitlines() if line.strip()]
+    new_lines = [line for line in lines if line.strip()]
+    return number if len(old_lines) == len(new_lines) else None
+
+
+def save_combined_document(doc, filename, prefix):
+    """Save a built document to the output directory and return its path."""
+    combined_filename = output_path(filename, prefix, "docx")
+    doc.save(combined_filename)
+    print(f"Combined DOCX {combined_filename} saved.")
+    return combined_filename
+
+
+def output_path(filename, prefix, output_format):
+    """Return the output path for a build, creating the output directory if needed."""
+    output_dir = os.getenv("OUTPUT_DIR", "./output")
+
+    # Create output directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Created output directory: {output_dir}")
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(output_dir, f"{prefix}{stem}{OUTPUT_EXTENSIONS[output_format]}")
+
+
+def replace_line_quotes(line):
+    """Curl the quotes of a tagged line, one text fragment at a time like add_formatted_runs."""
+    tag, content = parse_line(line)
+    content = "".join(
+        token if INLINE_TAG_REGEX.fullmatch(token) else replace_quotes(token)
+        for token in INLINE_TAG_REGEX.split(content)
+    )
+    return f"<{tag}>{content}</{tag}>"
+
+
+def save_formatted_document(lines, filename, prefix, output_format):
+    """Write tagged lines as an EPUB or Markdown document and return its path."""
+    path = output_path(filename, prefix, output_format)
+    lines = [replace_line_quotes(line.strip()) for line in lines if line.strip()]
+    title = os.path.splitext(os.path.basename(filename))[0]
+    write_lines(lines, path, output_format, title)
+    print(f"Combined {output_format} {path} saved.")
+    return path
+
+
+def rewrite_paragraph(para, line, restorer=None, key=None):
+    """Replace a source paragraph's text runs with the runs of an edited line.
+
+    The paragraph's properties are left untouched and the new runs take the place
+    of the old ones. Without a StyleRestorer, images and other opaque runs stay
+    where they are and new runs inherit the first old text run's formatting.
+    Quotes are left as the edited line has them.
+    """
+    line_match = LINE_TAG_REGEX.fullmatch(line)
+    content = line_match.group(2) if line_match else line
+
+    old_runs = [run for run in para.runs if restorer is not None or not is_object_run(run)]
+    base_rPr = None
+    if restorer is None:
+        text_runs = [run for run in old_runs if run._r.rPr is not None]
+        if text_runs:
+            base_rPr = copy.deepcopy(text_runs[0]._r.rPr)
+            for tag in INLINE_PROPERTY_TAGS:
+                for child in base_rPr.findall(tag):
+                    base_rPr.remove(child)
+
+    position = para._p.index(old_runs[0]._r) if old_runs else len(para._p)
+    for run in old_runs:
+        para._p.remove(run._r)
+
+    # New runs and objects are always appended after the existing children
+    existing_count = len(para._p)
+    add_formatted_runs(para, process_html_fragments(content), restorer, key, curl_quotes=False)
+    new_elements = list(para._p)[existing_count:]
+
+    for offset, element in enumerate(new_elements):
+        para._p.remove(element)
+        para._p.insert(position + offset, element)
+        if base_rPr is not None and element.tag == qn("w:r"):
+            run = Run(element, para)
+            bold, italic = run.bold, run.italic
+            if element.rPr is not None:
+                element.remove(element.rPr)
+            element.insert(0, copy.deepcopy(base_rPr))
+            run.bold, run.italic = bold, italic
+
+
+def save_from_template(filename, store, kind, prefix, side_channel=None):
+    """Write the output by editing a copy of the source DOCX in place.
+
+    Only paragraphs whose edited line differs from the original are rewritten;
+    every other paragraph keeps its XML, and styles, section settings, headers
+    and footers come along untouched. Quotes are never curled, so rewritten
+    paragraphs keep the same quote style as the rest of the source. Returns
+    False, without writing anything, if the edited sections no longer map
+    one-to-one onto the source paragraphs.
+    """
+    output_dir = os.getenv("OUTPUT_DIR", "./output")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Created output directory: {output_dir}")
+    output_filename = os.path.join(output_dir, f"{prefix}{os.path.basename(filename)}")
+
+    if kind == "old":
+        shutil.copyfile(filename, output_filename)
+        print(f"Source DOCX copied to {output_filename}.")
+        return True
+
+    # Pair every original line with its edited line, section by section
+    pairs = []
+    for number in store.numbers("old"):
+        old_lines = [line.strip() for line in store.read(number, "old").splitlines() if line.strip()]
+        if store.exists(number, "new"):
+            new_lines = [
+                line.strip() for line in store.read(number, "new").splitlines() if line.strip()
+            ]
+        else:
+            new_lines = old_lines
+        if len(new_lines) != len(old_lines):
+            print(f"Section {number} changed its paragraph count; rebuilding instead.")
+            return False
+        pairs.extend(
+            (f"{number}:{index}", old, new)
+            for index, (old, new) in enumerate(zip(old_lines, new_lines))
+        )
+
+    doc = Document(filename)
+    paragraphs = [para for para in doc.paragraphs if para.runs]
+    if len(paragraphs) != len(pairs):
+        print("Source paragraphs no longer match the split sections; rebuilding instead.")
+        return False
+
+    restorer = StyleRestorer(side_channel, filename, doc) if side_channel else None
+    changed = 0
+    for para, (key, old, new) in zip(paragraphs, pairs):
+        if new != old:
+            rewrite_paragraph(para, new, restorer, key)
+            changed += 1
+
+    doc.save(output_filename)
+    print(f"Rewrote {changed} of {len(paragraphs)} paragraphs; DOCX {output_filename} saved.")
+    return True
+
+
+def merge_groups_and_save(filename, action, template=False, output_format=None):
+    """Build the processed and original documents from the stored sections.
+
+    output_format is docx, epub or markdown and defaults to the input's own
+    format (Markdown for plain text). Template output needs DOCX in and out.
+    """
+    file = os.path.splitext(os.path.basename(filename))[0]
+    output_format = output_format or default_output_format(filename)
+    if template and (output_format != "docx" or input_format(filename) != "docx"):
+        print("[merge_groups_and_save] Template output needs DOCX input and output; rebuilding.")
+        template = False
     try:
         tmp_dir = f"./tmp/{file}"
-        output_dir = os.getenv("OUTPUT_DIR", "./output")
+        store = open_section_store(tmp_dir)
 
-        # Create output directory if it doesn't exist
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"Created output directory: {output_dir}")
+        # Restore formatting recorded by a keep_styles split
+        side_channel = load_side_channel(tmp_dir)
+        restorer = StyleRestorer(side_channel, filename) if side_channel else None
 
         # Process both .new and .old files
         for file_type in [".new", ".old"]:
             prefix = f"{action.upper()}_" if file_type == ".new" else "ORIGINAL_"
+            kind = file_type[1:]
+            if template and save_from_template(filename, store, kind, prefix, side_channel):
+                continue
+            if output_format != "docx":
+                lines = [
+                    line
+                    for number in store.numbers(kind)
+                    for line in store.read(number, kind).splitlines()
+                ]
+                save_formatted_document(lines, filename, prefix, output_format)
+                continue
+
             doc = Document()  # Initialize the Document outside the files loop
             seen_h1_heading = False
 
-            # Sort files by their numeric order
-            files = sorted(
-                [f for f in os.listdir(tmp_dir) if f.endswith(file_type)],
-                key=lambda x: int(x.split("-")[0]),
-            )
-
-            # Process files
-            for file in files:
-                print(f"Processing {file}...")
-                with open(os.path.join(tmp_dir, file), "r") as section_file:
-                    text_content = section_file.read().splitlines()
-
-                para = None
-                for line in text_content:
-                    line = line.strip()
-                    if not line:
-                        continue
-
-                    if line.startswith("<title>") and line.endswith("</title>"):
-                        line_content = replace_quotes(line[7:-8])
-                        para = doc.add_heading(line_content, level=1)
-                        para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        continue
-
-                    heading_match = HEADING_TAG_REGEX.fullmatch(line)
-                    if heading_match:
-                        heading_level = int(heading_match.group("level"))
-                        heading_content = heading_match.group(2)
-
-                        if heading_level == 1:
-                            if seen_h1_heading:
-                                doc.add_page_break()
-                            else:
-                                seen_h1_heading = True
-
-                        para = doc.add_heading("", level=heading_level)
-                        if heading_level == 1:
-                            para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-                        fragments = process_html_fragments(heading_content)
-                        if fragments:
-                            if para.runs:
-                                for run in para.runs:
-                                    run.text = ""
-                            add_formatted_runs(para, fragments)
-                        else:
-                            para.text = replace_quotes(heading_content)
-                        continue
-
-                    if line.startswith("<center>") and line.endswith("</center>"):
-                        line_content = line[8:-9]
-                        para = doc.add_paragraph()
-                        para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-                        fragments = process_html_fragments(line_content)
-                        add_formatted_runs(para, fragments)
-                        continue
-
-                    if line.startswith("<p>") and line.endswith("</p>"):
-                        line_content = line[3:-4]
-                        para = doc.add_paragraph()
-                        para.paragraph_format.first_line_indent = Inches(0.20)
-                        fragments = process_html_fragments(line_content)
-                        add_formatted_runs(para, fragments)
+            # Process sections in their numeric order
+            for number in store.numbers(kind):
+                print(f"Processing {number}-section{file_type}...")
+                text_content = store.read(number, kind).splitlines()
+                seen_h1_heading = append_section_lines(
+                    doc,
+                    text_content,
+                    seen_h1_heading,
+                    restorer,
+                    styled_section(store, number, text_content) if restorer else None,
+                )
 
             # Save the combined document
-            combined_filename = os.path.join(
-                output_dir, f"{prefix}{os.path.basename(filename)}"
-            )
-            doc.save(combined_filename)
-            print(f"Combined DOCX {combined_filename} saved.")
+            save_combined_document(doc, filename, prefix)
+
+        store.close()
 
     except Exception as e:
         raise Exception(f"Error in document merging and saving: {e}") from e
+
+
+def chapter_index(store):
+    """Map chapters to the sections they span, using the <h1> positions in the .old sections.
+
+    Returns (starts, spans): starts maps each section number to the chapter in
+    effect at its first line, and spans maps each chapter number to its first
+    and last section. Chapter 0 is any front matter before the first <h1>.
+    """
+    starts = {}
+    spans = {}
+    chapter = 0
+    for number in store.numbers("old"):
+        starts[number] = chapter
+        for line in store.read(number, "old").splitlines():
+            if not line.strip():
+                continue
+            if CHAPTER_TAG_REGEX.fullmatch(line.strip()):
+                chapter += 1
+            # Every line extends the span of the chapter it belongs to
+            spans.setdefault(chapter, [number, number])[1] = number
+    return starts, spans
+
+
+def build_preview(filename, chapters=None, sections=None, output_format=None):
+    """Build a preview of a chapter or section range from whatever is processed so far.
+
+    chapters and sections are inclusive (first, last) ranges. Each section uses
+    its .new text if the journal shows it was committed for the current .old
+    text and its .old text otherwise, so a preview can be rendered while the
+    rest of the book is still processing. Returns the path of the saved
+    PREVIEW_ document.
+    """
+    output_format = output_format or default_output_format(filename)
+    file = os.path.splitext(os.path.basename(filename))[0]
+    tmp_dir = f"./tmp/{file}"
+    if not os.path.exists(tmp_dir):
+        raise Exception("Temporary directory not found.")
+
+    store = open_section_store(tmp_dir)
+    try:
+        journal = open_journal(tmp_dir, store)
+        starts, spans = chapter_index(store)
+        if chapters is not None:
+            first, last = chapters
+            if first not in spans or last not in spans:
+                raise ValueError(
+                    f"Chapters {first}-{last} are out of range; the manuscript has chapters "
+                    f"{min(spans)}-{max(spans)}."
+                )
+            numbers = range(spans[first][0], spans[last][1] + 1)
+            prefix = f"PREVIEW_ch{first}-{last}_"
+        else:
+            first, last = sections
+            numbers = [number for number in starts if first <= number <= last]
+            if not numbers:
+                raise ValueError(f"Sections {first}-{last} are out of range.")
+            prefix = f"PREVIEW_s{first}-{last}_"
+
+        side_channel = load_side_channel(tmp_dir)
+        restorer = StyleRestorer(side_channel, filename) if side_channel else None
+        doc = Document() if output_format == "docx" else None
+        preview_lines = []
+        seen_h1_heading = False
+        for number in numbers:
+            kind = "new" if has_valid_new(store, journal, number) else "old"
+            print(f"Processing {number}-section.{kind}...")
+            lines = [line.strip() for line in store.read(number, kind).splitlines() if line.strip()]
+            section = styled_section(store, number, lines) if restorer else None
+
+            # Keep only the lines inside the chapter range
+            first_line = 0
+            if chapters is not None:
+                chapter = starts[number]
+                selected = []
+                for index, line in enumerate(lines):
+                    if CHAPTER_TAG_REGEX.fullmatch(line):
+                        chapter += 1
+                    if first <= chapter <= last:
+                        if not selected:
+                            first_line = index
+                        selected.append(line)
+                lines = selected
+
+            if doc is None:
+                preview_lines.extend(lines)
+                continue
+            seen_h1_heading = append_section_lines(
+                doc,
+                lines,
+                seen_h1_heading,
+                restorer,
+                section,
+                first_line,
+            )
+    finally:
+        store.close()
+
+    if doc is None:
+        return save_formatted_document(preview_lines, filename, prefix, output_format)
+    return save_combined_document(doc, filename, prefix)
@@ -0,0 +1,349 @@
+import datetime
+import html
+import os
+import posixpath
+import re
+import uuid
+import zipfile
+from urllib.parse import unquote
+
+from lxml import etree
+
+# Readers and writers around the tagged section lines (<p>, <hN>, <center>,
+# <title>, with inline <b> and <i>). DOCX is handled by docx_handler itself.
+INPUT_FORMATS = {
+    ".docx": "docx",
+    ".epub": "epub",
+    ".md": "markdown",
+    ".markdown": "markdown",
+    ".txt": "text",
+}
+OUTPUT_FORMATS = ["docx", "epub", "markdown"]
+OUTPUT_EXTENSIONS = {"docx": ".docx", "epub": ".epub", "markdown": ".md"}
+DEFAULT_OUTPUT_FORMATS = {"docx": "docx", "epub": "epub", "markdown": "markdown", "text": "markdown"}
+# Chapters start at each <h1> wherever they are counted: previews, diff reports and EPUB output
+CHAPTER_TAG = "h1"
+
+LINE_REGEX = re.compile(r"<(title|center|p|h([1-9]))>(.*)</\1>", re.DOTALL)
+INLINE_TAG_REGEX = re.compile(r"(</?[bi]>|</?r\d+>|<x\d+\s*/>)")
+# Any other tag-shaped text, such as a stray <em> or <br> from the model, is
+# markup to drop; a "<" that is not tag-shaped, as in "A < B", is text
+TAG_SHAPED_REGEX = re.compile(r"</?[A-Za-z][A-Za-z0-9]*\s*/?>")
+MARKDOWN_HEADING_REGEX = re.compile(r"(#{1,6})\s+(.*?)\s*#*\s*$")
+MARKDOWN_CENTER_REGEX = re.compile(r"<center>(.*)</center>", re.IGNORECASE)
+MARKDOWN_BOLD_REGEX = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+MARKDOWN_ITALIC_REGEX = re.compile(r"(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])")
+MARKDOWN_ESCAPE_REGEX = re.compile(r"\\([\\`*_{}\[\]()#+\-.!<>])")
+MARKDOWN_SPECIAL_REGEX = re.compile(r"([\\*_`])")
+
+XHTML_NS = "http://www.w3.org/1999/xhtml"
+CONTAINER_NS = "urn:oasis:names:tc:opendocument:xmlns:container"
+OPF_NS = "http://www.idpf.org/2007/opf"
+EPUB_BLOCK_TAGS = {"p", "h1", "h2", "h3", "h4", "h5", "h6", "li", "div", "blockquote"}
+EPUB_BOLD_TAGS = {"b", "strong"}
+EPUB_ITALIC_TAGS = {"i", "em", "cite"}
+
+
+def input_format(filename):
+    """Return the reader format for a file, or None if it is not supported."""
+    return INPUT_FORMATS.get(os.path.splitext(filename)[1].lower())
+
+
+def default_output_format(filename):
+    """Return the output format used when none is requested: the input's own, or Markdown for text."""
+    return DEFAULT_OUTPUT_FORMATS.get(input_format(filename), "docx")
+
+
+def parse_line(line):
+    """Return (tag, content) for a tagged section line, treating untagged text as a paragraph."""
+    match = LINE_REGEX.fullmatch(line.strip())
+    if not match:
+        return "p", line.strip()
+    return match.group(1), match.group(3)
+
+
+# ---------------------------------------------------------------------------
+# Readers: each yields tagged section lines one paragraph at a time
+# ---------------------------------------------------------------------------
+
+
+def _blocks(path):
+    """Yield the blank-line separated blocks of a text file as lists of lines."""
+    block = []
+    with open(path, "r", encoding="utf-8") as input_file:
+        for line in input_file:
+            line = line.rstrip("\n")
+            if line.strip():
+                block.append(line.strip())
+            elif block:
+                yield block
+                block = []
+    if block:
+        yield block
+
+
+def read_text(path):
+    """Yield a <p> line for each blank-line separated paragraph of a plain text file."""
+    for block in _blocks(path):
+        yield f"<p>{' '.join(block)}</p>"
+
+
+def markdown_inline(text):
+    """Convert Markdown emphasis to <b> and <i> tags."""
+    text = MARKDOWN_BOLD_REGEX.sub(r"<b>\2</b>", text)
+    text = MARKDOWN_ITALIC_REGEX.sub(r"<i>\2</i>", text)
+    return MARKDOWN_ESCAPE_REGEX.sub(r"\1", text)
+
+
+def _markdown_paragraph(lines):
+    text = " ".join(lines)
+    center = MARKDOWN_CENTER_REGEX.fullmatch(text)
+    if center:
+        return f"<center>{markdown_inline(center.group(1))}</center>"
+    return f"<p>{markdown_inline(text)}</p>"
+
+
+def read_markdown(path):
+    """Yield tagged lines for the headings and paragraphs of a Markdown file."""
+    for block in _blocks(path):
+        paragraph = []
+        for line in block:
+            # ATX headings end the paragraph they interrupt
+            heading = MARKDOWN_HEADING_REGEX.fullmatch(line)
+            if heading:
+                if paragraph:
+                    yield _markdown_paragraph(paragraph)
+                    paragraph = []
+                level = len(heading.group(1))
+                yield f"<h{level}>{markdown_inline(heading.group(2))}</h{level}>"
+            else:
+                paragraph.append(line)
+        if paragraph:
+            yield _markdown_paragraph(paragraph)
+
+
+def _local_name(element):
+    return etree.QName(element).localname.lower() if isinstance(element.tag, str) else ""
+
+
+def _epub_inline(element):
+    """Return an element's text with bold and italic children as <b> and <i> tags."""
+    parts = [element.text or ""]
+    for child in element:
+        name = _local_name(child)
+        if name == "br":
+            parts.append(" ")
+        elif name:
+            inner = _epub_inline(child)
+            if name in EPUB_BOLD_TAGS and inner.strip():
+                inner = f"<b>{inner}</b>"
+            elif name in EPUB_ITALIC_TAGS and inner.strip():
+                inner = f"<i>{inner}</i>"
+            parts.append(inner)
+        parts.append(child.tail or "")
+    return "".join(parts)
+
+
+def _is_centered(element):
+    style = (element.get("style") or "").replace(" ", "").lower()
+    classes = (element.get("class") or "").lower().split()
+    return "text-align:center" in style or "center" in classes or "centered" in classes
+
+
+def _epub_lines(element):
+    """Yield tagged lines for the innermost block elements under an element."""
+    for child in element:
+        name = _local_name(child)
+        if name not in EPUB_BLOCK_TAGS:
+            if name not in ["script", "style"]:
+                yield from _epub_lines(child)
+            continue
+        if any(_local_name(grandchild) in EPUB_BLOCK_TAGS for grandchild in child):
+            yield from _epub_lines(child)
+            continue
+        text = " ".join(_epub_inline(child).split())
+        if not text:
+            continue
+        if name.startswith("h"):
+            yield f"<{name}>{text}</{name}>"
+        elif _is_centered(child):
+            yield f"<center>{text}</center>"
+        else:
+            yield f"<p>{text}</p>"
+
+
+def read_epub(path):
+    """Yield tagged lines for every spine document of an EPUB, one document at a time."""
+    parser = etree.XMLParser(recover=True, resolve_entities=False, no_network=True)
+    with zipfile.ZipFile(path) as epub:
+        container = etree.fromstring(epub.read("META-INF/container.xml"), parser)
+        rootfile = container.find(f".//{{{CONTAINER_NS}}}rootfile").get("full-path")
+        package = etree.fromstring(epub.read(rootfile), parser)
+        base = posixpath.dirname(rootfile)
+
+        manifest = {
+            item.get("id"): item.get("href")
+            for item in package.iter(f"{{{OPF_NS}}}item")
+        }
+        for itemref in package.iter(f"{{{OPF_NS}}}itemref"):
+            href = manifest.get(itemref.get("idref"))
+            if not href or itemref.get("linear") == "no":
+                continue
+            document = etree.fromstring(epub.read(posixpath.join(base, unquote(href))), parser)
+            if document is None:
+                continue
+            body = next((el for el in document.iter() if _local_name(el) == "body"), document)
+            yield from _epub_lines(body)
+
+
+READERS = {"epub": read_epub, "markdown": read_markdown, "text": read_text}
+
+
+def read_lines(path):
+    """Yield the tagged section lines of a non-DOCX input file."""
+    reader = READERS.get(input_format(path))
+    if reader is None:
+        raise ValueError(f"No reader for {path}.")
+    return reader(path)
+
+
+# ---------------------------------------------------------------------------
+# Writers: each renders a list of tagged lines into a file
+# ---------------------------------------------------------------------------
+
+
+def _inline_tokens(content):
+    """Split line content into inline tags and text, dropping placeholders and unknown tags."""
+    for token in INLINE_TAG_REGEX.split(content):
+        if not INLINE_TAG_REGEX.fullmatch(token):
+            token = TAG_SHAPED_REGEX.sub("", token)
+        if not token or token.startswith("<r") or token.startswith("</r") or token.startswith("<x"):
+            continue
+        yield token
+
+
+def markdown_line(line):
+    """Render one tagged line as a Markdown block."""
+    tag, content = parse_line(line)
+    text = ""
+    for token in _inline_tokens(content):
+        if token in ["<b>", "</b>"]:
+            text += "**"
+        elif token in ["<i>", "</i>"]:
+            text += "*"
+        else:
+            text += MARKDOWN_SPECIAL_REGEX.sub(r"\\\1", token)
+    if tag == "title":
+        return f"# {text}"
+    if tag.startswith("h"):
+        return f"{'#' * min(int(tag[1]), 6)} {text}"
+    if tag == "center":
+        return f"<center>{text}</center>"
+    if text.lstrip().startswith("#"):
+        text = "\\" + text.lstrip()
+    return text
+
+
+def write_markdown(lines, path):
+    """Write tagged lines as a Markdown file."""
+    with open(path, "w", encoding="utf-8") as output_file:
+        output_file.write("\n\n".join(markdown_line(line) for line in lines) + "\n")
+
+
+def xhtml_line(line):
+    """Render one tagged line as an XHTML block element."""
+    tag, content = parse_line(line)
+    body = "".join(
+        token if token in ["<b>", "</b>", "<i>", "</i>"] else html.escape(token, quote=False)
+        for token in _inline_tokens(content)
+    )
+    if tag == "title":
+        return f'<h1 class="title">{body}</h1>'
+    if tag == "center":
+        return f'<p style="text-align: center">{body}</p>'
+    if tag.startswith("h"):
+        # XHTML stops at <h6>; DOCX Heading 7-9 lines are clamped to it
+        tag = f"h{min(int(tag[1]), 6)}"
+    return f"<{tag}>{body}</{tag}>"
+
+
+def _xhtml_document(title, blocks):
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        f'<html xmlns="{XHTML_NS}" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+        f"<head><title>{html.escape(title)}</title></head>\n"
+        f"<body>\n{chr(10).join(blocks)}\n</body>\n</html>\n"
+    )
+
+
+def write_epub(lines, path, title, language="und"):
+    """Write tagged lines as an EPUB 3 book with one document per <h1> chapter."""
+    chapters = []
+    for line in lines:
+        tag, content = parse_line(line)
+        if tag == CHAPTER_TAG or not chapters:
+            heading = TAG_SHAPED_REGEX.sub("", content) if tag == CHAPTER_TAG else title
+            chapters.append({"title": heading, "blocks": []})
+        chapters[-1]["blocks"].append(xhtml_line(line))
+
+    manifest = []
+    spine = []
+    nav = []
+    # EPUB 3 requires the last modification time, in UTC to the second
+    modified = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    with zipfile.ZipFile(path, "w") as epub:
+        # The mimetype must come first and be stored uncompressed
+        epub.writestr("mimetype", "application/epub+zip", compress_type=zipfile.ZIP_STORED)
+        epub.writestr(
+            "META-INF/container.xml",
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<container version="1.0" xmlns="{CONTAINER_NS}"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            "</rootfiles></container>\n",
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+        for index, chapter in enumerate(chapters, start=1):
+            href = f"chapter-{index}.xhtml"
+            epub.writestr(
+                f"OEBPS/{href}",
+                _xhtml_document(chapter["title"], chapter["blocks"]),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+            manifest.append(
+                f'<item id="chapter-{index}" href="{href}" media-type="application/xhtml+xml"/>'
+            )
+            spine.append(f'<itemref idref="chapter-{index}"/>')
+            nav.append(f'<li><a href="{href}">{html.escape(chapter["title"])}</a></li>')
+
+        epub.writestr(
+            "OEBPS/nav.xhtml",
+            _xhtml_document(
+                title, [f'<nav epub:type="toc"><ol>{"".join(nav)}</ol></nav>']
+            ),
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+        epub.writestr(
+            "OEBPS/content.opf",
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<package xmlns="{OPF_NS}" version="3.0" unique-identifier="book-id">\n'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            f'<dc:identifier id="book-id">urn:uuid:{uuid.uuid4()}</dc:identifier>'
+            f"<dc:title>{html.escape(title)}</dc:title>"
+            f"<dc:language>{html.escape(language)}</dc:language>"
+            f'<meta property="dcterms:modified">{modified}</meta>'
+            "</metadata>\n"
+            '<manifest><item id="nav" href="nav.xhtml" media-type="application/xhtml+xml" '
+            f'properties="nav"/>{"".join(manifest)}</manifest>\n'
+            f'<spine>{"".join(spine)}</spine>\n</package>\n',
+            compress_type=zipfile.ZIP_DEFLATED,
+        )
+
+
+def write_lines(lines, path, output_format, title):
+    """Write tagged lines to path in a non-DOCX output format."""
+    if output_format == "markdown":
+        write_markdown(lines, path)
+    elif output_format == "epub":
+        write_epub(lines, path, title)
+    else:
+        raise ValueError(f"No writer for {output_format}.")
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows; the thread lock still applies
+    fcntl = None
+
+JOURNAL_FILENAME = "journal.jsonl"
+
+
+def text_hash(text):
+    """Return the SHA-256 hex digest of a section's text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    """Return the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for block in iter(lambda: input_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Journal:
+    """Write-ahead journal of a manuscript's split and processed sections.
+
+    Each line is a JSON record: a "split" header with the input hash, split
+    parameters and every .old section's hash, then a "begin" record before a
+    section is sent and a "commit" record once its .new output is durably
+    stored. A .new section is only trusted if a commit record matches the
+    current .old text, the .new text and the prompt. A torn last line left by
+    a crash is ignored.
+    """
+
+    def __init__(self, tmp_dir):
+        self.path = os.path.join(tmp_dir, JOURNAL_FILENAME)
+        self.lock = threading.Lock()
+        self.header = None
+        self.commits = {}
+        self._torn_tail = False
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as journal_file:
+            for line in journal_file:
+                # Start the next append on a fresh line after a torn record
+                self._torn_tail = not line.endswith("\n")
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("type") == "split":
+                    self.header = record
+                elif record.get("type") == "commit":
+                    self.commits[record["section"]] = record
+
+    def _write(self, journal_file, records):
+        if fcntl is not None:
+            fcntl.flock(journal_file, fcntl.LOCK_EX)
+        try:
+            for record in records:
+                journal_file.write(json.dumps(record, sort_keys=True) + "\n")
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(journal_file, fcntl.LOCK_UN)
+
+    def append(self, record):
+        """Durably append one record."""
+        with self.lock:
+            with open(self.path, "a", encoding="utf-8") as journal_file:
+                if self._torn_tail:
+                    journal_file.write("\n")
+                    self._torn_tail = False
+                self._write(journal_file, [record])
+            if record["type"] == "commit":
+                self.commits[record["section"]] = record
+
+    def record_split(self, input_hash, section_size, keep_styles, section_hashes):
+        """Start a new journal generation for a split, keeping commits still valid for it.
+
+        The journal is rewritten atomically, so it only ever holds the latest
+        split and the latest commit of each section.
+        """
+        header = {
+            "type": "split",
+            "input": input_hash,
+            "section_size": section_size,
+            "keep_styles": keep_styles,
+            "sections": {str(n): h for n, h in enumerate(section_hashes, start=1)},
+        }
+        with self.lock:
+            kept = {
+                number: record
+                for number, record in self.commits.items()
+                if header["sections"].get(str(number)) == record["old"]
+            }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as journal_file:
+                self._write(journal_file, [header] + [kept[n] for n in sorted(kept)])
+            os.replace(tmp_path, self.path)
+            self.header = header
+            self.commits = kept
+            self._torn_tail = False
+
+    def same_split(self, input_hash, section_size, keep_styles):
+        """Return True if the last split used the same input and parameters."""
+        return self.header is not None and (
+            self.header["input"],
+            self.header["section_size"],
+            self.header["keep_styles"],
+        ) == (input_hash, section_size, keep_styles)
+
+    def begin(self, number, old_text, job):
+        self.append({"type": "begin", "section": number, "old": text_hash(old_text), "job": job})
+
+    def commit(self, number, old_text, new_text, job):
+        self.append(
+            {
+                "type": "commit",
+                "section": number,
+                "old": text_hash(old_text),
+                "new": text_hash(new_text),
+                "job": job,
+            }
+        )
+
+    def is_valid(self, number, old_text, new_text, job=None):
+        """Return True if a stored .new section is a committed result for its .old text.
+
+        With job None any prompt matches, and commits adopted from a run without
+        a journal match any prompt.
+        """
+        record = self.commits.get(number)
+        return (
+            record is not None
+            and record["old"] == text_hash(old_text)
+            and record["new"] == text_hash(new_text)
+            and (job is None or record["job"] in (None, job))
+        )
+
+
+def open_journal(tmp_dir, store):
+    """Open a manuscript's journal, creating it on first use.
+
+    Section directories from before journaling have .new files but no
+    journal; those sections are adopted as committed so resume keeps trusting
+    them, and later runs are checked against the journal.
+    """
+    journal = Journal(tmp_dir)
+    if not os.path.exists(journal.path):
+        new_numbers = set(store.numbers("new"))
+        for number in store.numbers("old"):
+            if number in new_numbers:
+                journal.commit(number, store.read(number, "old"), store.read(number, "new"), None)
+        # Make sure the journal exists even with nothing to adopt
+        open(journal.path, "a").close()
+    return journal
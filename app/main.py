@@ -1,28 +1,54 @@
 import argparse
-import os
-from docx_handler import process_manuscript, merge_groups_and_save, split_into_sections, cleanup_temp_files
+from docx_handler import (
+    build_preview,
+    cleanup_temp_files,
+    export_section_store,
+    import_section_store,
+    merge_groups_and_save,
+)
+from formats import OUTPUT_FORMATS
+from pipeline import parse_range, run_job, validate_job
+from planner import PLAN_SECTION_SIZES, plan_job, recommend, recommended_command
+from prompts import compile_prompt, list_prompts, load_prompt
+from report import report_manuscript
+from service import serve
+from verify import requeue_sections, verify_sections
 
 
 def main():
     # Initialize the manuscript editor and set up the command line arguments
     print("Initializing manuscript editor.")
     parser = argparse.ArgumentParser(
-        description="Process a manuscript file in DOCX format."
+        description="Process a manuscript file in DOCX, EPUB, Markdown or plain text format."
     )
     subparsers = parser.add_subparsers(dest="command", help="Available commands")
 
     # Set up the 'edit' command
-    edit_parser = subparsers.add_parser("edit", help="Edit a DOCX file")
-    edit_parser.add_argument("filename", type=str, help="Path to the DOCX file")
+    edit_parser = subparsers.add_parser("edit", help="Edit a manuscript file")
+    edit_parser.add_argument(
+        "filename", type=str, help="Path to the DOCX, EPUB, Markdown or text file"
+    )
     edit_parser.add_argument(
         "sections",
         type=int,
         help="Number of sections to split the manuscript into before editing",
     )
+    edit_parser.add_argument(
+        "--diff",
+        action="store_true",
+        help="Ask the model for a compact list of replacements instead of the full text",
+    )
+    edit_parser.add_argument(
+        "--prepass",
+        action="store_true",
+        help="Fix mechanical issues locally before calling the model and skip clean sections",
+    )
 
     # Set up the 'translate' command
-    translate_parser = subparsers.add_parser("translate", help="Translate a DOCX file")
-    translate_parser.add_argument("filename", type=str, help="Path to the DOCX file")
+    translate_parser = subparsers.add_parser("translate", help="Translate a manuscript file")
+    translate_parser.add_argument(
+        "filename", type=str, help="Path to the DOCX, EPUB, Markdown or text file"
+    )
     translate_parser.add_argument(
         "language", type=str, help="Language to translate the manuscript into"
     )
@@ -32,13 +58,122 @@ def main():
         help="Number of sections to split the manuscript into before translating",
     )
 
+    # Options for overlapping the split, API and build stages
+    for job_parser in [edit_parser, translate_parser]:
+        job_parser.add_argument(
+            "--stream",
+            action="store_true",
+            help="Dispatch sections as they are read and build the output as they complete",
+        )
+        job_parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=4,
+            help="Maximum number of sections in flight when streaming (default: 4)",
+        )
+        job_parser.add_argument(
+            "--prompt",
+            type=str,
+            default=None,
+            help="Name of the prompt from the prompt library (defaults to the command name)",
+        )
+        job_parser.add_argument(
+            "--keep-styles",
+            action="store_true",
+            help="Preserve underline, small caps, fonts, paragraph layout and images via a local side-channel",
+        )
+        job_parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Check each processed section against the original and redo failing sections",
+        )
+
     # Set up the 'build' command
     build_parser = subparsers.add_parser(
-        "build", help="Build a final DOCX from processed sections"
+        "build", help="Build the final documents from processed sections"
     )
     build_parser.add_argument(
         "filename", type=str, help="Path to the processed DOCX file"
     )
+    build_range = build_parser.add_mutually_exclusive_group()
+    build_range.add_argument(
+        "--chapters",
+        type=parse_range,
+        default=None,
+        help="Build a preview of chapters N or N-M, using .old text for unprocessed sections",
+    )
+    build_range.add_argument(
+        "--sections",
+        type=parse_range,
+        default=None,
+        help="Build a preview of sections N or N-M, using .old text for unprocessed sections",
+    )
+
+    # Output mode shared by every command that builds documents
+    for output_parser in [edit_parser, translate_parser, build_parser]:
+        output_parser.add_argument(
+            "--template",
+            action="store_true",
+            help="Write output by editing a copy of the source DOCX, rewriting only changed paragraphs",
+        )
+        output_parser.add_argument(
+            "--format",
+            choices=OUTPUT_FORMATS,
+            default=None,
+            help="Output format (default: the input's format, or markdown for plain text)",
+        )
+
+    # Set up the 'verify' command
+    verify_parser = subparsers.add_parser(
+        "verify", help="Check processed sections for dropped paragraphs, broken tags and commentary"
+    )
+    verify_parser.add_argument(
+        "filename", type=str, help="Path to the DOCX file whose sections to check"
+    )
+    verify_parser.add_argument(
+        "--mode",
+        choices=["edit", "translate"],
+        default="edit",
+        help="Thresholds to check against; translations allow larger length changes",
+    )
+    verify_parser.add_argument(
+        "--requeue",
+        action="store_true",
+        help="Delete the .new output of failing sections so the next run redoes them",
+    )
+
+    # Set up the 'diff' command
+    diff_parser = subparsers.add_parser(
+        "diff", help="Report what changed between the original and processed sections"
+    )
+    diff_parser.add_argument(
+        "filename", type=str, help="Path to the DOCX file whose sections to compare"
+    )
+    diff_parser.add_argument(
+        "--format",
+        choices=["html", "docx", "both"],
+        default="html",
+        help="Write an HTML report, a tracked-changes DOCX, or both (default: html)",
+    )
+
+    # Set up the 'plan' command
+    plan_parser = subparsers.add_parser(
+        "plan", help="Estimate requests, tokens, cost and time per section size without calling the API"
+    )
+    plan_parser.add_argument("filename", type=str, help="Path to the manuscript file")
+    plan_parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=PLAN_SECTION_SIZES,
+        help="Section sizes to compare (default: 256 512 1024 2048)",
+    )
+    plan_parser.add_argument(
+        "--prompt", type=str, default="edit", help="Prompt whose length to include (default: edit)"
+    )
+    plan_parser.add_argument(
+        "--language", type=str, default="English", help="Language for translate prompts"
+    )
 
     # Set up the 'cleanup' command
     cleanup_parser = subparsers.add_parser(
@@ -48,85 +183,152 @@ def main():
         "filename", type=str, help="Path to the DOCX file to clean up temp files for"
     )
 
+    # Set up the 'store' command
+    store_parser = subparsers.add_parser(
+        "store", help="Export or import a packed section store"
+    )
+    store_parser.add_argument(
+        "operation",
+        choices=["export", "import"],
+        help="Export the pack to section files, or import section files into the pack",
+    )
+    store_parser.add_argument(
+        "filename", type=str, help="Path to the DOCX file whose sections to convert"
+    )
+
+    # Set up the 'prompts' command
+    subparsers.add_parser("prompts", help="List the prompts in the prompt library")
+
+    # Set up the 'serve' command
+    serve_parser = subparsers.add_parser(
+        "serve", help="Run a local HTTP job service with warm workers"
+    )
+    serve_parser.add_argument(
+        "--host", type=str, default="127.0.0.1", help="Address to listen on"
+    )
+    serve_parser.add_argument(
+        "--port", type=int, default=8080, help="Port to listen on"
+    )
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of concurrent jobs (defaults to SERVICE_WORKERS or 2)",
+    )
+
     # Parse the provided command line arguments
     args = parser.parse_args()
 
     try:
-        # Check if the file exists for commands that require a file
-        if args.command in ["edit", "translate", "build", "cleanup"]:
-            if not os.path.exists(args.filename):
-                print(f"Error: The file {args.filename} does not exist.")
-                exit(1)
-
-            # Validate file extension (except for cleanup which works with any filename)
-            if args.command != "cleanup" and not args.filename.lower().endswith('.docx'):
-                print(f"Error: {args.filename} must be a DOCX file.")
-                exit(1)
-
-        # Validate section count for edit and translate commands
-        if args.command in ["edit", "translate"]:
-            if args.sections <= 0:
-                print("Error: Number of sections must be greater than 0.")
-                exit(1)
-            if args.sections > 4096:  # Reasonable upper limit
-                print("Error: Number of sections should not exceed 4096.")
+        # Validate the arguments for commands that require a file
+        if args.command in ["edit", "translate", "build", "verify", "diff", "plan", "cleanup", "store"]:
+            error = validate_job(
+                args.command,
+                args.filename,
+                args.sizes if args.command == "plan" else getattr(args, "sections", None),
+                getattr(args, "concurrency", None),
+            )
+            if error:
+                print(f"Error: {error}")
                 exit(1)
 
         if args.command == "edit":
-            # Define user instructions for editing
-            user_prefix = "Review and correct the following text with minimal changes. Output the corrected text with no comments before or after:"
-            system_message = "As a renowned romance book editor, review and correct books with minimal changes. Focus on proper spelling, grammar, and punctuation while maintaining consistency in verb tenses, contractions, and compound words. Correct run-on sentences and ensure accurate punctuation in dialogues and inner monologues without altering their structure or wording. Preserve the author's voice and meaning. First, address spelling and typographical errors, followed by grammar and punctuation. Do not add or remove cammas before the use of and.  Ensure verb tense consistency throughout. Use <i> and </i> tags for inner monologue and long-form media titles, but not for emphasis. Only correct spelling in dialogues and inner monologues; avoid changing adjectives or expletives unless fixing a spelling error. Maintain all newlines and HTML formatting as in the original text, with minimal changes."
-            action = "EDIT"
-
-            # Begin the editing process
-            print(
-                f"Editing {args.filename} after splitting into {args.sections} sections..."
+            run_job(
+                "edit",
+                args.filename,
+                args.sections,
+                diff_mode=args.diff,
+                prepass=args.prepass,
+                stream=args.stream,
+                concurrency=args.concurrency,
+                keep_styles=args.keep_styles,
+                template=args.template,
+                prompt=args.prompt,
+                verify=args.verify,
+                output_format=args.format,
             )
-            sections = split_into_sections(args.filename, args.sections)
-            print(f"{args.filename}: Split into {len(sections)} sections.")
-
-            # Process each section
-            process_manuscript(args.filename, system_message, user_prefix)
             print("Manuscript editing completed.")
 
-            # Build the final version of the edited manuscript
-            print("Building the edited manuscript...")
-            merge_groups_and_save(args.filename, action)
-            print("Edited manuscript saved.")
-
         elif args.command == "translate":
-            # Define user instructions for translation
-            user_prefix = f"1. Translate the text from English to {args.language} based on your rules with no comments before or after:"
-            system_message = "You are a renowned expert in literary translation. Use the following rules to correct text: 1. Rather than adhering to a literal, word-for-word translation, deeply consider the distinct cultural nuances, structural and syntactical variations, grammatical norms, idiomatic expressions, and cultural contexts of each language. 2. Make appropriate adjustments to ensure these elements are accurately represented, while still preserving the original tone and intent of the text and maintaining the original HTML structure. 3. Don't wrap output in ```html ```"
-            action = args.language
-
-            # Begin the translation process
-            print(
-                f"Translating {args.filename} into {args.language} after splitting into {args.sections} sections..."
+            run_job(
+                "translate",
+                args.filename,
+                args.sections,
+                language=args.language,
+                stream=args.stream,
+                concurrency=args.concurrency,
+                keep_styles=args.keep_styles,
+                template=args.template,
+                prompt=args.prompt,
+                verify=args.verify,
+                output_format=args.format,
             )
-            sections = split_into_sections(args.filename, args.sections)
-            print(f"{args.filename}: Split into {len(sections)} sections.")
-
-            # Process each section
-            process_manuscript(args.filename, system_message, user_prefix)
             print("Manuscript translation completed.")
 
-            # Build the final version of the edited manuscript
-            print("Building the edited manuscript...")
-            merge_groups_and_save(args.filename, action)
-            print("Translated manuscript saved.")
+        elif args.command == "build" and (args.chapters or args.sections):
+            if args.template:
+                print("Error: --template cannot be combined with --chapters or --sections.")
+                exit(1)
+            print(f"Building preview for {args.filename}...")
+            build_preview(args.filename, args.chapters, args.sections, args.format)
 
         elif args.command == "build":
             action = "BUILD"
             print(f"Building final document for {args.filename}...")
-            merge_groups_and_save(args.filename, action)
+            merge_groups_and_save(args.filename, action, args.template, args.format)
             print(f"Final document {args.filename} built and saved.")
 
+        elif args.command == "verify":
+            failures = verify_sections(args.filename, args.mode)
+            if failures and args.requeue:
+                requeue_sections(args.filename, failures)
+                print(f"Re-queued {len(failures)} sections.")
+
+        elif args.command == "diff":
+            report_manuscript(
+                args.filename,
+                html_report=args.format in ["html", "both"],
+                tracked_docx=args.format in ["docx", "both"],
+            )
+
+        elif args.command == "plan":
+            compiled = compile_prompt(args.prompt, language=args.language)
+            options = plan_job(
+                args.filename, compiled.system_message, compiled.user_prefix, args.sizes
+            )
+            print("size  conc  requests  input tok  output tok  truncated     cost      time")
+            for option in options:
+                print(
+                    f"{option.section_size:>4}  {option.concurrency:>4}  {option.requests:>8}  "
+                    f"{option.input_tokens:>9}  {option.output_tokens:>10}  {option.truncated:>9}  "
+                    f"${option.cost:>7.2f}  {option.seconds / 60:>6.1f}m"
+                )
+            best = recommend(options)
+            print(
+                f"Recommended: sections {best.section_size}, concurrency {best.concurrency} "
+                f"(~${best.cost:.2f}, ~{best.seconds / 60:.1f} min): "
+                f"{recommended_command(args.filename, args.prompt, args.language, best)}"
+            )
+
         elif args.command == "cleanup":
             print(f"Cleaning up temporary files for {args.filename}...")
             cleanup_temp_files(args.filename)
             print("Cleanup completed.")
 
+        elif args.command == "store":
+            if args.operation == "export":
+                export_section_store(args.filename)
+            else:
+                import_section_store(args.filename)
+
+        elif args.command == "prompts":
+            for name in list_prompts():
+                prompt = load_prompt(name)
+                print(f"{name} (v{prompt['version']}): {prompt.get('description', '')}")
+
+        elif args.command == "serve":
+            serve(args.host, args.port, args.workers)
+
         else:
             print("No valid command selected.")
     except Exception as e:
@@ -0,0 +1,202 @@
+import asyncio
+import os
+from docx_handler import process_manuscript, merge_groups_and_save, split_into_sections
+from formats import INPUT_FORMATS, input_format
+from prompts import compile_prompt
+from streaming import stream_manuscript
+from verify import requeue_sections, verify_sections
+
+MAX_SECTION_SIZE = 4096  # Reasonable upper limit
+DEFAULT_VERIFY_RETRIES = 2
+
+
+def validate_job(command, filename, sections=None, concurrency=None):
+    """Return an error message if a command's arguments are invalid, else None.
+
+    For plan, sections is the list of section sizes to compare.
+    """
+    # Check if the file exists for commands that require a file
+    if not os.path.exists(filename):
+        return f"The file {filename} does not exist."
+
+    # Validate file extension (except for cleanup and store which work with any filename)
+    if command not in ["cleanup", "store"] and input_format(filename) is None:
+        return f"{filename} must be one of: {', '.join(INPUT_FORMATS)}."
+
+    # Validate section count for edit and translate commands, and every size to plan
+    if command in ["edit", "translate"] or (command == "plan" and sections is not None):
+        for size in sections if command == "plan" else [sections]:
+            if size <= 0:
+                return "Number of sections must be greater than 0."
+            if size > MAX_SECTION_SIZE:
+                return f"Number of sections should not exceed {MAX_SECTION_SIZE}."
+
+    # A streamed job with no request slots would never finish
+    if concurrency is not None and concurrency < 1:
+        return "Concurrency must be at least 1."
+
+    return None
+
+
+def parse_range(text):
+    """Parse "3-5" or "12" into an inclusive (first, last) range."""
+    first, _, last = text.partition("-")
+    try:
+        first = int(first)
+        last = int(last) if last else first
+    except ValueError:
+        raise ValueError(f"Invalid range '{text}'; use N or N-M.")
+    if first < 0 or last < first:
+        raise ValueError(f"Invalid range '{text}'; use N or N-M with N <= M.")
+    return first, last
+
+
+def run_job(
+    command,
+    filename,
+    sections,
+    language=None,
+    diff_mode=False,
+    prepass=False,
+    progress=None,
+    stream=False,
+    concurrency=4,
+    keep_styles=False,
+    template=False,
+    prompt=None,
+    verify=False,
+    output_format=None,
+):
+    """Split, process and build a manuscript for an edit or translate job.
+
+    progress, if given, is called with a dict for every pipeline event. With
+    stream, the three stages overlap and up to `concurrency` sections are in
+    flight at once. keep_styles records the source formatting in a local
+    side-channel and restores it in the built documents, and template writes
+    the output by editing a copy of the source DOCX. prompt names the library
+    prompt to use and defaults to the command's own prompt. With verify, each
+    .new section is checked against its .old section and failing sections
+    are processed again, up to VERIFY_RETRIES times. output_format is docx,
+    epub or markdown and defaults to the input's own format.
+    """
+
+    def emit(event, **details):
+        if progress is not None:
+            progress({"event": event, **details})
+
+    if command == "edit":
+        compiled = compile_prompt(prompt or "edit")
+        action = "EDIT"
+        print(f"Editing {filename} after splitting into {sections} sections...")
+    elif command == "translate":
+        compiled = compile_prompt(prompt or "translate", language=language)
+        action = language
+        # The diff and pre-pass modes only make sense for same-language edits
+        diff_mode = prepass = False
+        print(
+            f"Translating {filename} into {language} after splitting into {sections} sections..."
+        )
+    else:
+        raise ValueError(f"Unknown job command: {command}")
+
+    system_message = compiled.system_message
+    user_prefix = compiled.user_prefix
+    print(f"Using prompt {compiled.name} v{compiled.version} ({compiled.hash[:12]}).")
+    emit("prompt", name=compiled.name, version=compiled.version, hash=compiled.hash)
+
+    if stream:
+        asyncio.run(
+            stream_manuscript(
+                filename,
+                sections,
+                system_message,
+                user_prefix,
+                action,
+                diff_mode,
+                prepass,
+                concurrency,
+                progress,
+                keep_styles,
+                template,
+                output_format,
+                compiled.hash,
+            )
+        )
+        # The streamed output is only rebuilt if verification redid sections
+        if verify and verify_and_requeue(
+            filename,
+            command,
+            system_message,
+            user_prefix,
+            diff_mode,
+            prepass,
+            progress,
+            compiled.hash,
+        ):
+            merge_groups_and_save(filename, action, template, output_format)
+            emit("built", action=action.upper())
+        print("Processed manuscript saved.")
+        return
+
+    split = split_into_sections(filename, sections, keep_styles)
+    print(f"{filename}: Split into {len(split)} sections.")
+    emit("split", sections=len(split))
+
+    # Process each section
+    process_manuscript(
+        filename, system_message, user_prefix, diff_mode, prepass, progress, compiled.hash
+    )
+    if verify:
+        verify_and_requeue(
+            filename,
+            command,
+            system_message,
+            user_prefix,
+            diff_mode,
+            prepass,
+            progress,
+            compiled.hash,
+        )
+    print("Manuscript processing completed.")
+    emit("processed")
+
+    # Build the final version of the manuscript
+    print("Building the processed manuscript...")
+    merge_groups_and_save(filename, action, template, output_format)
+    print("Processed manuscript saved.")
+    emit("built", action=action.upper())
+
+
+def verify_and_requeue(
+    filename,
+    command,
+    system_message,
+    user_prefix,
+    diff_mode,
+    prepass,
+    progress=None,
+    prompt_hash=None,
+):
+    """Verify processed sections and reprocess failing ones.
+
+    Returns True if any section was reprocessed. Sections still failing after
+    the last retry are kept and reported, so the job can still be built.
+    """
+    retries = int(os.getenv("VERIFY_RETRIES", DEFAULT_VERIFY_RETRIES))
+    requeued = False
+    for attempt in range(retries + 1):
+        failures = verify_sections(filename, command)
+        if progress is not None:
+            progress({"event": "verified", "attempt": attempt, "failed": sorted(failures)})
+        if not failures:
+            break
+        if attempt == retries:
+            print(f"Warning: sections still failing verification: {sorted(failures)}")
+            break
+        print(f"Re-queueing {len(failures)} sections that failed verification...")
+        requeue_sections(filename, failures)
+        process_manuscript(
+            filename, system_message, user_prefix, diff_mode, prepass, progress, prompt_hash
+        )
+        requeued = True
+    return requeued
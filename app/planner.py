@@ -0,0 +1,183 @@
+import json
+import math
+import os
+import shlex
+from collections import namedtuple
+
+from docx_handler import group_sections, iter_paragraph_lines
+from prompts import PLACEHOLDER_REGEX, load_prompt
+
+try:
+    import tiktoken
+except ImportError:  # Optional; fall back to a words-based estimate
+    tiktoken = None
+
+PLAN_SECTION_SIZES = [256, 512, 1024, 2048]
+PLAN_CONCURRENCY = [1, 2, 4, 8]
+WORDS_TO_TOKENS = 1.33
+MESSAGE_OVERHEAD_TOKENS = 12  # Role and formatting tokens added per request
+MAX_OUTPUT_TOKENS = 3072  # max_tokens sent by api.py
+NEAR_BEST_TIME = 1.1  # Prefer cheaper options within 10% of the fastest
+
+# Used until LATENCY_LOG holds enough requests to fit a model
+DEFAULT_LATENCY_BASE = 1.0  # Seconds per request
+DEFAULT_LATENCY_PER_TOKEN = 0.02  # Seconds per output token
+
+PlanOption = namedtuple(
+    "PlanOption",
+    [
+        "section_size",
+        "concurrency",
+        "requests",
+        "input_tokens",
+        "output_tokens",
+        "truncated",
+        "cost",
+        "seconds",
+    ],
+)
+
+
+def token_counter(model=None):
+    """Return a function counting tokens with tiktoken, or estimating them from words."""
+    if tiktoken is not None:
+        try:
+            encoding = tiktoken.encoding_for_model(model or os.getenv("MODEL", "gpt-4o"))
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return lambda text: len(encoding.encode(text))
+    return lambda text: math.ceil(len(text.split()) * WORDS_TO_TOKENS)
+
+
+def fit_latency(path=None):
+    """Fit seconds = base + per_token * output_tokens to the logged request latencies."""
+    path = path or os.getenv("LATENCY_LOG")
+    points = []
+    if path and os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as log_file:
+            for line in log_file:
+                try:
+                    entry = json.loads(line)
+                    points.append((float(entry["output_tokens"]), float(entry["seconds"])))
+                except (ValueError, KeyError, TypeError):
+                    continue
+
+    if len(points) < 2:
+        return DEFAULT_LATENCY_BASE, DEFAULT_LATENCY_PER_TOKEN
+
+    # Ordinary least squares on a single variable
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    variance = sum((x - mean_x) ** 2 for x, _ in points)
+    if variance == 0:
+        return mean_y, 0.0
+    per_token = sum((x - mean_x) * (y - mean_y) for x, y in points) / variance
+    per_token = max(per_token, 0.0)
+    return max(mean_y - per_token * mean_x, 0.0), per_token
+
+
+def estimate_seconds(latencies, concurrency, total_tokens, rpm, tpm):
+    """Estimate the wall time to send every request at a given concurrency.
+
+    The job can finish no faster than its slowest request, the total latency
+    spread over the workers, or the rate limits allow.
+    """
+    if not latencies:
+        return 0.0
+    return max(
+        max(latencies),
+        sum(latencies) / concurrency,
+        60.0 * len(latencies) / rpm if rpm else 0.0,
+        60.0 * total_tokens / tpm if tpm else 0.0,
+    )
+
+
+def plan_job(
+    filename,
+    system_message,
+    user_prefix,
+    section_sizes=None,
+    concurrency_levels=None,
+    count_tokens=None,
+    latency=None,
+):
+    """Split a manuscript at each section size and predict requests, tokens, cost and time.
+
+    Nothing is sent to the API. Rate limits and prices come from PLAN_RPM,
+    PLAN_TPM, PLAN_INPUT_PRICE and PLAN_OUTPUT_PRICE (USD per million tokens).
+    Returns one PlanOption per section size and concurrency level.
+    """
+    count_tokens = count_tokens or token_counter()
+    base, per_token = latency or fit_latency()
+    rpm = float(os.getenv("PLAN_RPM", 500))
+    tpm = float(os.getenv("PLAN_TPM", 200000))
+    input_price = float(os.getenv("PLAN_INPUT_PRICE", 2.50))
+    output_price = float(os.getenv("PLAN_OUTPUT_PRICE", 10.00))
+    prompt_tokens = count_tokens(system_message) + count_tokens(user_prefix)
+    # Parse the manuscript once and regroup its lines for every size
+    paragraph_lines = [(line, None) for line, _ in iter_paragraph_lines(filename)]
+
+    options = []
+    for section_size in section_sizes or PLAN_SECTION_SIZES:
+        section_tokens = [
+            count_tokens("\n".join(section))
+            for section in group_sections(paragraph_lines, section_size)
+        ]
+        # An edit or translation returns about as many tokens as it is sent
+        outputs = [min(tokens, MAX_OUTPUT_TOKENS) for tokens in section_tokens]
+        input_tokens = sum(section_tokens) + len(section_tokens) * (
+            prompt_tokens + MESSAGE_OVERHEAD_TOKENS
+        )
+        output_tokens = sum(outputs)
+        latencies = [base + per_token * tokens for tokens in outputs]
+        cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+        for concurrency in concurrency_levels or PLAN_CONCURRENCY:
+            options.append(
+                PlanOption(
+                    section_size,
+                    concurrency,
+                    len(section_tokens),
+                    input_tokens,
+                    output_tokens,
+                    sum(1 for tokens in section_tokens if tokens > MAX_OUTPUT_TOKENS),
+                    cost,
+                    estimate_seconds(
+                        latencies, concurrency, input_tokens + output_tokens, rpm, tpm
+                    ),
+                )
+            )
+    return options
+
+
+def recommend(options):
+    """Pick the cheapest, least concurrent option within 10% of the fastest.
+
+    Section sizes whose sections would exceed the response limit are only
+    considered when every size would.
+    """
+    safe = [option for option in options if not option.truncated] or options
+    fastest = min(option.seconds for option in safe)
+    near_best = [option for option in safe if option.seconds <= fastest * NEAR_BEST_TIME]
+    return min(near_best, key=lambda option: (option.cost, option.concurrency, option.seconds))
+
+
+def recommended_command(filename, prompt_name, language, option):
+    """Return the edit or translate command line that runs a plan option.
+
+    Prompts with a {language} placeholder are translation prompts.
+    """
+    prompt = load_prompt(prompt_name)
+    placeholders = PLACEHOLDER_REGEX.findall(prompt["system"] + prompt["user_prefix"])
+    if "language" in placeholders:
+        command = ["translate", filename, language, str(option.section_size)]
+        default_prompt = "translate"
+    else:
+        command = ["edit", filename, str(option.section_size)]
+        default_prompt = "edit"
+    if prompt_name != default_prompt:
+        command += ["--prompt", prompt_name]
+    # Concurrency above one needs the streaming pipeline
+    if option.concurrency > 1:
+        command += ["--stream", "--concurrency", str(option.concurrency)]
+    return shlex.join(command)
@@ -0,0 +1,138 @@
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Pre-compile regular expressions for the mechanical fixes
+TAG_REGEX = re.compile(r"(<[^>]+>)")
+REPEATED_WORD_REGEX = re.compile(r"\b(\w+)(\s+)\1\b", re.IGNORECASE)
+MULTI_SPACE_REGEX = re.compile(r"(?<=\S) {2,}(?=\S)")
+SPACED_ELLIPSIS_REGEX = re.compile(r"\.\s\.\s\.")
+SPACE_BEFORE_ELLIPSIS_REGEX = re.compile(r"(?<=\w)\s+(?=\.\.\.|…)")
+DASH_REGEX = re.compile(r"(?<!-)--(?!-)")
+WORD_REGEX = re.compile(r"[A-Za-z]+(?:['’][A-Za-z]+)*")
+SENTENCE_START_REGEX = re.compile(r"(?:^|[.!?]\s+)([a-z])")
+
+# Doubled words that are grammatical English and never need a review
+ALLOWED_REPEATS = {"had", "that", "is", "very", "no", "so"}
+
+PrepassResult = namedtuple("PrepassResult", ["text", "fixes", "needs_model"])
+
+
+@lru_cache(maxsize=None)
+def load_corrections(path):
+    """Load a spelling dictionary of 'misspelling correction' lines and compile it."""
+    corrections = {}
+    with open(path, "r", encoding="utf-8") as dictionary_file:
+        for line in dictionary_file:
+            parts = line.split()
+            if len(parts) == 2 and not line.startswith("#"):
+                corrections[parts[0].lower()] = parts[1]
+
+    if not corrections:
+        return None, corrections
+
+    # One alternation over every misspelling, longest first, compiled once per run
+    alternatives = sorted(corrections, key=len, reverse=True)
+    pattern = re.compile(
+        r"\b(" + "|".join(re.escape(word) for word in alternatives) + r")\b",
+        re.IGNORECASE,
+    )
+    return pattern, corrections
+
+
+@lru_cache(maxsize=None)
+def load_wordlist(path):
+    """Load a set of known words, one per line."""
+    with open(path, "r", encoding="utf-8") as wordlist_file:
+        return frozenset(line.strip().lower() for line in wordlist_file if line.strip())
+
+
+def _fix_text(text, fixes, corrections):
+    """Apply mechanical fixes to a text fragment that contains no tags."""
+    text, count = MULTI_SPACE_REGEX.subn(" ", text)
+    fixes["double_spaces"] += count
+
+    text, count = SPACED_ELLIPSIS_REGEX.subn("...", text)
+    fixes["ellipses"] += count
+    text, count = SPACE_BEFORE_ELLIPSIS_REGEX.subn("", text)
+    fixes["ellipses"] += count
+
+    # Only the double hyphen is replaced; the author's spacing around it is kept
+    text, count = DASH_REGEX.subn("—", text)
+    fixes["dashes"] += count
+
+    pattern, table = corrections
+    if pattern is not None:
+
+        def correct_spelling(match):
+            fixes["spelling"] += 1
+            replacement = table[match.group(1).lower()]
+            if match.group(1)[0].isupper():
+                replacement = replacement[0].upper() + replacement[1:]
+            return replacement
+
+        text = pattern.sub(correct_spelling, text)
+
+    return text
+
+
+def _has_repeated_word(line):
+    """Return True if a line doubles a word outside the allowed repeats.
+
+    Repeats are never collapsed locally because many are deliberate ("Ha ha",
+    "Knock knock"); the model decides.
+    """
+    return any(
+        match.group(1).lower() not in ALLOWED_REPEATS
+        for match in REPEATED_WORD_REGEX.finditer(line)
+    )
+
+
+def _needs_model(text, wordlist):
+    """Report whether a section still has issues only the model can fix.
+
+    Without a known-word list nothing can be ruled out, so every section is sent.
+    """
+    if wordlist is None:
+        return True
+
+    plain_lines = [TAG_REGEX.sub("", line) for line in text.split("\n")]
+    for line in plain_lines:
+        if _has_repeated_word(line):
+            return True
+        if line.count('"') % 2 or line.count("“") != line.count("”"):
+            return True
+        if SENTENCE_START_REGEX.search(line.strip()):
+            return True
+        for word in WORD_REGEX.findall(line):
+            if word.lower().replace("’", "'") not in wordlist:
+                return True
+    return False
+
+
+def prepass_section(section_text):
+    """Fix mechanical issues in a section locally and report what remains.
+
+    Spelling corrections come from the dictionary in PREPASS_DICTIONARY and the
+    clean-section check uses the word list in PREPASS_WORDLIST; both are optional.
+    """
+    dictionary_path = os.getenv("PREPASS_DICTIONARY")
+    wordlist_path = os.getenv("PREPASS_WORDLIST")
+    corrections = load_corrections(dictionary_path) if dictionary_path else (None, {})
+    wordlist = load_wordlist(wordlist_path) if wordlist_path else None
+
+    fixes = {"double_spaces": 0, "ellipses": 0, "dashes": 0, "spelling": 0}
+    lines = []
+    for line in section_text.split("\n"):
+        # Only touch the text between tags so the markup is never altered
+        parts = TAG_REGEX.split(line)
+        lines.append(
+            "".join(
+                part if index % 2 else _fix_text(part, fixes, corrections)
+                for index, part in enumerate(parts)
+            )
+        )
+
+    text = "\n".join(lines)
+    return PrepassResult(text, fixes, _needs_model(text, wordlist))
@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+DEFAULT_PROMPT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+REQUIRED_FIELDS = {"name", "version", "system", "user_prefix"}
+# Only {identifier} is a placeholder, so other braces, such as a JSON example, are literal
+PLACEHOLDER_REGEX = re.compile(r"\{([A-Za-z_]\w*)\}")
+
+CompiledPrompt = namedtuple(
+    "CompiledPrompt", ["name", "version", "system_message", "user_prefix", "hash"]
+)
+
+
+def prompt_dir():
+    """Return the directory the prompt library is loaded from."""
+    return os.getenv("PROMPT_DIR", DEFAULT_PROMPT_DIR)
+
+
+@lru_cache(maxsize=None)
+def _load_prompt_file(path, mtime):
+    with open(path, "r", encoding="utf-8") as prompt_file:
+        prompt = json.load(prompt_file)
+    missing = REQUIRED_FIELDS - set(prompt)
+    if missing:
+        raise ValueError(f"Prompt file {path} is missing: {', '.join(sorted(missing))}")
+    return prompt
+
+
+def load_prompt(name):
+    """Load a prompt definition from the library by name.
+
+    Parsed files are cached by path and modification time, so edited prompt
+    files are picked up by a running service without a restart.
+    """
+    # Names come from requests too, so they must not reach outside the library
+    if not isinstance(name, str) or not name or "/" in name or "\\" in name or ".." in name:
+        raise ValueError(f"Invalid prompt name '{name}'.")
+    path = os.path.join(prompt_dir(), f"{name}.json")
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown prompt '{name}'. Available prompts: {', '.join(list_prompts())}")
+    return _load_prompt_file(path, os.path.getmtime(path))
+
+
+def list_prompts():
+    """Return the names of every prompt in the library."""
+    directory = prompt_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(os.path.splitext(f)[0] for f in os.listdir(directory) if f.endswith(".json"))
+
+
+def _fill(template, values):
+    def placeholder(match):
+        if match.group(1) not in values:
+            raise KeyError(match.group(1))
+        return str(values[match.group(1)])
+
+    return PLACEHOLDER_REGEX.sub(placeholder, template)
+
+
+@lru_cache(maxsize=None)
+def _compile(name, version, system, user_prefix, params):
+    values = dict(params)
+    system_message = _fill(system, values)
+    prefix = _fill(user_prefix, values)
+    # Hash the exact text sent to the model so equal prompts give equal keys
+    digest = hashlib.sha256(
+        json.dumps(
+            {"name": name, "version": version, "system": system_message, "user_prefix": prefix},
+            sort_keys=True,
+        ).encode("utf-8")
+    ).hexdigest()
+    return CompiledPrompt(name, version, system_message, prefix, digest)
+
+
+def compile_prompt(name, **params):
+    """Load a prompt and fill in its placeholders, such as {language}, once per job."""
+    prompt = load_prompt(name)
+    try:
+        return _compile(
+            prompt["name"],
+            prompt["version"],
+            prompt["system"],
+            prompt["user_prefix"],
+            tuple(sorted(params.items())),
+        )
+    except KeyError as e:
+        raise ValueError(f"Prompt '{name}' needs a value for {e}") from e
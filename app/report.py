@@ -0,0 +1,279 @@
+import datetime
+import html
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+from docx import Document
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+
+from formats import CHAPTER_TAG, TAG_SHAPED_REGEX, parse_line as parse_tagged_line
+from section_store import open_section_store
+
+TOKEN_REGEX = re.compile(r"\s+|\w+|[^\w\s]")
+WORD_REGEX = re.compile(r"\w+")
+TRACKED_AUTHOR = "v-chatgpt-editor"
+
+# segments is None for unchanged paragraphs, else a list of (op, text) where
+# op is "equal", "delete" or "insert"
+ParagraphDiff = namedtuple("ParagraphDiff", ["section", "tag", "old", "new", "segments"])
+ChapterSummary = namedtuple(
+    "ChapterSummary",
+    ["title", "paragraphs", "changed_paragraphs", "words", "changed_words", "density"],
+)
+ManuscriptDiff = namedtuple("ManuscriptDiff", ["paragraphs", "chapters"])
+
+
+def parse_line(line):
+    """Return (tag, plain text) for a tagged section line."""
+    tag, content = parse_tagged_line(line)
+    return tag, TAG_SHAPED_REGEX.sub("", content)
+
+
+def diff_words(old_text, new_text):
+    """Return the word-level (op, text) segments turning old_text into new_text."""
+    old_tokens = TOKEN_REGEX.findall(old_text)
+    new_tokens = TOKEN_REGEX.findall(new_text)
+    segments = []
+    matcher = SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            segments.append(("equal", "".join(old_tokens[i1:i2])))
+            continue
+        if i2 > i1:
+            segments.append(("delete", "".join(old_tokens[i1:i2])))
+        if j2 > j1:
+            segments.append(("insert", "".join(new_tokens[j1:j2])))
+    return segments
+
+
+def diff_section(args):
+    """Align a section's paragraphs and word-diff the changed ones."""
+    number, old_text, new_text = args
+    old_lines = [parse_line(line.strip()) for line in old_text.splitlines() if line.strip()]
+    new_lines = [parse_line(line.strip()) for line in new_text.splitlines() if line.strip()]
+    paragraphs = []
+
+    # Align whole paragraphs first so word diffs only run on changed ones
+    matcher = SequenceMatcher(
+        None, [text for _, text in old_lines], [text for _, text in new_lines], autojunk=False
+    )
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op == "equal":
+            for tag, text in old_lines[i1:i2]:
+                paragraphs.append(ParagraphDiff(number, tag, text, text, None))
+            continue
+        # Pair replaced paragraphs in order; leftovers are whole insertions or deletions
+        for offset in range(max(i2 - i1, j2 - j1)):
+            old_tag, old = old_lines[i1 + offset] if i1 + offset < i2 else (None, "")
+            new_tag, new = new_lines[j1 + offset] if j1 + offset < j2 else (None, "")
+            paragraphs.append(
+                ParagraphDiff(number, new_tag or old_tag, old, new, diff_words(old, new))
+            )
+    return paragraphs
+
+
+def changed_words(paragraph):
+    """Return the number of words deleted or inserted in a paragraph."""
+    if paragraph.segments is None:
+        return 0
+    return sum(len(WORD_REGEX.findall(text)) for op, text in paragraph.segments if op != "equal")
+
+
+def chapter_summary(paragraphs):
+    """Group paragraph diffs into chapters at each <h1> and total their changes."""
+    chapters = []
+    current = None
+    for paragraph in paragraphs:
+        is_heading = paragraph.tag == CHAPTER_TAG
+        if is_heading or current is None:
+            title = (paragraph.new or paragraph.old) if is_heading else "Front matter"
+            current = {"title": title, "paragraphs": []}
+            chapters.append(current)
+        current["paragraphs"].append(paragraph)
+
+    summaries = []
+    for chapter in chapters:
+        words = sum(len(WORD_REGEX.findall(p.old)) for p in chapter["paragraphs"])
+        changed = sum(changed_words(p) for p in chapter["paragraphs"])
+        summaries.append(
+            ChapterSummary(
+                chapter["title"],
+                len(chapter["paragraphs"]),
+                sum(1 for p in chapter["paragraphs"] if p.segments is not None),
+                words,
+                changed,
+                changed / max(words, 1),
+            )
+        )
+    return summaries
+
+
+def diff_manuscript(filename, workers=None):
+    """Diff every section of a manuscript in a process pool.
+
+    Sections without a .new file are treated as unchanged. Returns a
+    ManuscriptDiff with every paragraph in order and the per-chapter summary.
+    """
+    file = os.path.splitext(os.path.basename(filename))[0]
+    tmp_dir = f"./tmp/{file}"
+    if not os.path.exists(tmp_dir):
+        raise Exception("Temporary directory not found.")
+
+    store = open_section_store(tmp_dir)
+    try:
+        new_numbers = set(store.numbers("new"))
+        jobs = []
+        for number in store.numbers("old"):
+            old_text = store.read(number, "old")
+            new_text = store.read(number, "new") if number in new_numbers else old_text
+            jobs.append((number, old_text, new_text))
+    finally:
+        store.close()
+
+    workers = workers or int(os.getenv("DIFF_WORKERS", 0)) or os.cpu_count() or 1
+    if workers == 1 or len(jobs) < 2:
+        results = list(map(diff_section, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            chunksize = max(1, len(jobs) // (workers * 4))
+            results = list(executor.map(diff_section, jobs, chunksize=chunksize))
+
+    paragraphs = [paragraph for section in results for paragraph in section]
+    return ManuscriptDiff(paragraphs, chapter_summary(paragraphs))
+
+
+def _output_path(filename, prefix, extension):
+    output_dir = os.getenv("OUTPUT_DIR", "./output")
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Created output directory: {output_dir}")
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(output_dir, f"{prefix}{stem}{extension}")
+
+
+def write_html_report(filename, manuscript_diff):
+    """Write an HTML report of the chapter heatmap and every changed paragraph."""
+    rows = []
+    for index, chapter in enumerate(manuscript_diff.chapters, start=1):
+        # Shade the row by change density; 50% of words changed is full red
+        alpha = min(1.0, chapter.density * 2)
+        rows.append(
+            f'<tr style="background: rgba(220, 50, 47, {alpha:.2f})">'
+            f'<td><a href="#chapter-{index}">{html.escape(chapter.title)}</a></td>'
+            f"<td>{chapter.changed_paragraphs}/{chapter.paragraphs}</td>"
+            f"<td>{chapter.changed_words}/{chapter.words}</td>"
+            f"<td>{chapter.density:.1%}</td></tr>"
+        )
+
+    body = []
+    chapter_index = 0
+    for paragraph in manuscript_diff.paragraphs:
+        if paragraph.tag == CHAPTER_TAG or chapter_index == 0:
+            chapter_index += 1
+            title = manuscript_diff.chapters[chapter_index - 1].title
+            body.append(f'<h2 id="chapter-{chapter_index}">{html.escape(title)}</h2>')
+        if paragraph.segments is None:
+            continue
+        parts = []
+        for op, text in paragraph.segments:
+            text = html.escape(text)
+            if op == "delete":
+                parts.append(f"<del>{text}</del>")
+            elif op == "insert":
+                parts.append(f"<ins>{text}</ins>")
+            else:
+                parts.append(text)
+        body.append(
+            f'<p><span class="section">§{paragraph.section}</span> {"".join(parts)}</p>'
+        )
+
+    stem = html.escape(os.path.basename(filename))
+    report = f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Changes in {stem}</title>
+<style>
+body {{ font-family: Georgia, serif; max-width: 50em; margin: 2em auto; }}
+table {{ border-collapse: collapse; }}
+td, th {{ padding: 0.2em 0.8em; text-align: left; }}
+del {{ color: #b00; }}
+ins {{ color: #070; }}
+.section {{ color: #888; font-size: 0.8em; }}
+</style>
+</head>
+<body>
+<h1>Changes in {stem}</h1>
+<table>
+<tr><th>Chapter</th><th>Paragraphs changed</th><th>Words changed</th><th>Density</th></tr>
+{chr(10).join(rows)}
+</table>
+{chr(10).join(body)}
+</body>
+</html>
+"""
+    path = _output_path(filename, "DIFF_", ".html")
+    with open(path, "w", encoding="utf-8") as report_file:
+        report_file.write(report)
+    print(f"Diff report {path} saved.")
+    return path
+
+
+def _tracked_run(para, op, text, change_id, date):
+    """Append text to a paragraph as a plain, inserted or deleted run."""
+    r = OxmlElement("w:r")
+    t = OxmlElement("w:delText" if op == "delete" else "w:t")
+    t.set(qn("xml:space"), "preserve")
+    t.text = text
+    r.append(t)
+    if op == "equal":
+        para._p.append(r)
+        return
+    change = OxmlElement("w:del" if op == "delete" else "w:ins")
+    change.set(qn("w:id"), str(change_id))
+    change.set(qn("w:author"), TRACKED_AUTHOR)
+    change.set(qn("w:date"), date)
+    change.append(r)
+    para._p.append(change)
+
+
+def write_tracked_docx(filename, manuscript_diff):
+    """Write a DOCX of the edited text with every change as a Word tracked change."""
+    doc = Document()
+    date = datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    change_id = 0
+    for paragraph in manuscript_diff.paragraphs:
+        if paragraph.tag == "title":
+            para = doc.add_heading("", level=1)
+        elif paragraph.tag.startswith("h"):
+            para = doc.add_heading("", level=int(paragraph.tag[1]))
+        else:
+            para = doc.add_paragraph()
+        for op, text in paragraph.segments or [("equal", paragraph.old)]:
+            change_id += 1
+            _tracked_run(para, op, text, change_id, date)
+
+    path = _output_path(filename, "TRACKED_", ".docx")
+    doc.save(path)
+    print(f"Tracked changes DOCX {path} saved.")
+    return path
+
+
+def report_manuscript(filename, html_report=True, tracked_docx=False):
+    """Diff a manuscript, print the chapter summary and write the requested reports."""
+    manuscript_diff = diff_manuscript(filename)
+    for chapter in manuscript_diff.chapters:
+        print(
+            f"{chapter.title[:40]:<40} {chapter.changed_paragraphs:>5}/{chapter.paragraphs:<5} "
+            f"paragraphs {chapter.changed_words:>6} words changed ({chapter.density:.1%})"
+        )
+    paths = []
+    if html_report:
+        paths.append(write_html_report(filename, manuscript_diff))
+    if tracked_docx:
+        paths.append(write_tracked_docx(filename, manuscript_diff))
+    return paths
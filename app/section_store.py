@@ -0,0 +1,199 @@
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+PACK_FILENAME = "sections.pack"
+
+# Record header: magic, kind, section number, payload length, payload CRC32
+RECORD_HEADER = struct.Struct("<4sBIII")
+RECORD_MAGIC = b"VSEC"
+KIND_CODES = {"old": 0, "new": 1}
+CODE_KINDS = {code: kind for kind, code in KIND_CODES.items()}
+TOMBSTONE_FLAG = 0x80  # Set on the kind code of an empty record that deletes a section
+
+
+class DirectoryStore:
+    """Section store backed by one N-section.old / N-section.new file per section."""
+
+    def __init__(self, tmp_dir):
+        self.tmp_dir = tmp_dir
+
+    def _path(self, number, kind):
+        return os.path.join(self.tmp_dir, f"{number}-section.{kind}")
+
+    def numbers(self, kind):
+        """Return the sorted section numbers stored for a kind."""
+        return sorted(
+            int(f.split("-")[0])
+            for f in os.listdir(self.tmp_dir)
+            if f.endswith(f"-section.{kind}")
+        )
+
+    def exists(self, number, kind):
+        return os.path.exists(self._path(number, kind))
+
+    def read(self, number, kind):
+        with open(self._path(number, kind), "r") as section_file:
+            return section_file.read()
+
+    def write(self, number, kind, text):
+        # Write to a temporary file and rename it so a crash never leaves a torn section
+        path = self._path(number, kind)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as section_file:
+            section_file.write(text)
+            section_file.flush()
+            os.fsync(section_file.fileno())
+        os.replace(tmp_path, path)
+
+    def delete(self, number, kind):
+        if os.path.exists(self._path(number, kind)):
+            os.remove(self._path(number, kind))
+
+    def close(self):
+        pass
+
+
+class PackedStore:
+    """Section store backed by a single append-only file read through mmap.
+
+    Every write appends a self-describing record, so the offset index is rebuilt
+    by scanning record headers on open and the latest record for a section wins.
+    A torn record left by a crash fails its length or CRC check and is truncated
+    away before the next append. Reads and appends are serialized by a lock so
+    one store can be shared between worker threads.
+    """
+
+    def __init__(self, tmp_dir):
+        self.tmp_dir = tmp_dir
+        self.path = os.path.join(tmp_dir, PACK_FILENAME)
+        self.index = {}
+        self.lock = threading.Lock()
+        self._map = None
+        self._map_size = 0
+
+        if not os.path.exists(self.path):
+            open(self.path, "ab").close()
+
+        valid_size = self._scan()
+        if valid_size != os.path.getsize(self.path):
+            print(f"[section_store] Truncating incomplete record at offset {valid_size}")
+            self._unmap()
+            with open(self.path, "r+b") as pack_file:
+                pack_file.truncate(valid_size)
+                os.fsync(pack_file.fileno())
+
+    def _unmap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            self._map_size = 0
+
+    def _remap(self):
+        self._unmap()
+        size = os.path.getsize(self.path)
+        if size:
+            with open(self.path, "rb") as pack_file:
+                self._map = mmap.mmap(pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._map_size = size
+
+    def _scan(self):
+        """Build the offset index and return the size of the valid prefix."""
+        self._remap()
+        offset = 0
+        while offset + RECORD_HEADER.size <= self._map_size:
+            magic, code, number, length, crc = RECORD_HEADER.unpack_from(self._map, offset)
+            start = offset + RECORD_HEADER.size
+            end = start + length
+            kind = CODE_KINDS.get(code & ~TOMBSTONE_FLAG)
+            if magic != RECORD_MAGIC or kind is None or end > self._map_size:
+                break
+            if zlib.crc32(self._map[start:end]) != crc:
+                break
+            if code & TOMBSTONE_FLAG:
+                self.index.pop((kind, number), None)
+            else:
+                self.index[(kind, number)] = (start, length)
+            offset = end
+        return offset
+
+    def numbers(self, kind):
+        with self.lock:
+            keys = list(self.index)
+        return sorted(number for stored_kind, number in keys if stored_kind == kind)
+
+    def exists(self, number, kind):
+        return (kind, number) in self.index
+
+    def read(self, number, kind):
+        with self.lock:
+            try:
+                start, length = self.index[(kind, number)]
+            except KeyError:
+                raise FileNotFoundError(f"Section {number}.{kind} not found in {self.path}")
+            if start + length > self._map_size:
+                self._remap()
+            return self._map[start : start + length].decode("utf-8")
+
+    def _append(self, code, number, payload):
+        header = RECORD_HEADER.pack(RECORD_MAGIC, code, number, len(payload), zlib.crc32(payload))
+        with open(self.path, "ab") as pack_file:
+            offset = pack_file.tell()
+            pack_file.write(header + payload)
+            pack_file.flush()
+            os.fsync(pack_file.fileno())
+        return offset + RECORD_HEADER.size
+
+    def write(self, number, kind, text):
+        payload = text.encode("utf-8")
+        with self.lock:
+            start = self._append(KIND_CODES[kind], number, payload)
+            self.index[(kind, number)] = (start, len(payload))
+
+    def delete(self, number, kind):
+        """Append a tombstone so the section no longer exists after reopening."""
+        with self.lock:
+            if (kind, number) in self.index:
+                self._append(KIND_CODES[kind] | TOMBSTONE_FLAG, number, b"")
+                del self.index[(kind, number)]
+
+    def export_files(self):
+        """Write every stored section out in the N-section.old/.new file layout."""
+        directory = DirectoryStore(self.tmp_dir)
+        count = 0
+        for kind, number in sorted(self.index):
+            directory.write(number, kind, self.read(number, kind))
+            count += 1
+        return count
+
+    def import_files(self):
+        """Append every N-section.old/.new file in the tmp directory to the pack."""
+        directory = DirectoryStore(self.tmp_dir)
+        count = 0
+        for kind in KIND_CODES:
+            for number in directory.numbers(kind):
+                self.write(number, kind, directory.read(number, kind))
+                count += 1
+        return count
+
+    def close(self):
+        self._unmap()
+
+
+def open_section_store(tmp_dir):
+    """Open the section store for a tmp directory.
+
+    SECTION_STORE selects "files" or "packed"; when unset, an existing pack file
+    is used so later commands follow whichever layout the split produced.
+    """
+    mode = os.getenv("SECTION_STORE")
+    if mode is None:
+        mode = "packed" if os.path.exists(os.path.join(tmp_dir, PACK_FILENAME)) else "files"
+
+    if mode == "packed":
+        return PackedStore(tmp_dir)
+    if mode == "files":
+        return DirectoryStore(tmp_dir)
+    raise ValueError(f"Unknown SECTION_STORE mode: {mode}")
@@ -0,0 +1,243 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipeline import run_job, validate_job
+from formats import OUTPUT_FORMATS
+from prompts import load_prompt
+
+TERMINAL_STATES = {"done", "failed"}
+
+
+class JobService:
+    """Runs manuscript jobs on a warm worker pool and records their progress events.
+
+    Workers share this process's imports, OpenAI client connection pool and
+    module-level caches, so each job only pays for its own API calls. Only the
+    most recent finished jobs are kept (SERVICE_RETAINED_JOBS, default 100).
+    """
+
+    def __init__(self, workers=None, retained_jobs=None):
+        self.workers = workers or int(os.getenv("SERVICE_WORKERS", "2"))
+        self.retained_jobs = (
+            retained_jobs
+            if retained_jobs is not None
+            else int(os.getenv("SERVICE_RETAINED_JOBS", "100"))
+        )
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self.jobs = {}
+        self.condition = threading.Condition()
+
+    def submit(self, payload):
+        """Validate a job request and queue it, returning the job record."""
+        command = payload.get("command")
+        filename = payload.get("filename")
+        sections = payload.get("sections")
+        language = payload.get("language")
+        concurrency = payload.get("concurrency", 4)
+
+        if command not in ["edit", "translate"]:
+            raise ValueError("command must be 'edit' or 'translate'.")
+        if (
+            not isinstance(filename, str)
+            or not isinstance(sections, int)
+            or isinstance(sections, bool)
+        ):
+            raise ValueError("filename (string) and sections (integer) are required.")
+        if command == "translate" and not language:
+            raise ValueError("language is required for translate jobs.")
+        if not isinstance(concurrency, int) or isinstance(concurrency, bool):
+            raise ValueError("concurrency must be an integer.")
+        error = validate_job(command, filename, sections, concurrency)
+        if error:
+            raise ValueError(error)
+        load_prompt(payload.get("prompt") or command)
+        if payload.get("format") not in [None] + OUTPUT_FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(OUTPUT_FORMATS)}.")
+
+        # Jobs for the same manuscript name share ./tmp/{file}, so run them one at a time
+        stem = os.path.splitext(os.path.basename(filename))[0]
+        with self.condition:
+            if any(
+                job["stem"] == stem and job["state"] not in TERMINAL_STATES
+                for job in self.jobs.values()
+            ):
+                raise RuntimeError(f"A job for {stem} is already queued or running.")
+
+            job = {
+                "id": uuid.uuid4().hex,
+                "stem": stem,
+                "command": command,
+                "filename": filename,
+                "sections": sections,
+                "language": language,
+                "state": "queued",
+                "error": None,
+                "events": [],
+            }
+            self.jobs[job["id"]] = job
+            self._record(job, {"event": "queued"})
+
+        options = {
+            "diff_mode": bool(payload.get("diff", False)),
+            "prepass": bool(payload.get("prepass", False)),
+            "stream": bool(payload.get("stream", False)),
+            "concurrency": concurrency,
+            "keep_styles": bool(payload.get("keep_styles", False)),
+            "template": bool(payload.get("template", False)),
+            "prompt": payload.get("prompt"),
+            "verify": bool(payload.get("verify", False)),
+            "output_format": payload.get("format"),
+        }
+        self.executor.submit(self._run, job, options)
+        return job
+
+    def _record(self, job, event):
+        """Append an event to a job and wake any streaming readers."""
+        with self.condition:
+            job["events"].append({"time": time.time(), **event})
+            self.condition.notify_all()
+
+    def _run(self, job, options):
+        with self.condition:
+            job["state"] = "running"
+        self._record(job, {"event": "started"})
+        try:
+            run_job(
+                job["command"],
+                job["filename"],
+                job["sections"],
+                language=job["language"],
+                progress=lambda event: self._record(job, event),
+                **options,
+            )
+        except Exception as e:
+            with self.condition:
+                job["state"] = "failed"
+                job["error"] = str(e)
+            self._record(job, {"event": "failed", "error": str(e)})
+        else:
+            with self.condition:
+                job["state"] = "done"
+            self._record(job, {"event": "done"})
+        self._evict_finished()
+
+    def _evict_finished(self):
+        """Forget the oldest finished jobs beyond the retention count."""
+        with self.condition:
+            finished = [job for job in self.jobs.values() if job["state"] in TERMINAL_STATES]
+            finished.sort(key=lambda job: job["events"][-1]["time"])
+            for job in finished[: max(len(finished) - self.retained_jobs, 0)]:
+                del self.jobs[job["id"]]
+
+    def summary(self, job):
+        """Return the public view of a job without its event log."""
+        with self.condition:
+            view = {key: value for key, value in job.items() if key not in ("events", "stem")}
+            view["event_count"] = len(job["events"])
+        return view
+
+    def stream_events(self, job, timeout=None):
+        """Yield a job's events as they arrive until it reaches a terminal state."""
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(job["events"]) and job["state"] not in TERMINAL_STATES:
+                    if not self.condition.wait(timeout):
+                        return
+                pending = job["events"][index:]
+                finished = job["state"] in TERMINAL_STATES
+            for event in pending:
+                yield event
+            index += len(pending)
+            if finished and index >= len(job["events"]):
+                return
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def make_handler(service):
+    """Build the HTTP request handler class bound to a JobService."""
+
+    class JobRequestHandler(BaseHTTPRequestHandler):
+        def _send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _find_job(self, job_id):
+            job = service.jobs.get(job_id)
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job {job_id}"})
+            return job
+
+        def do_POST(self):
+            if self.path != "/jobs":
+                self._send_json(404, {"error": "Not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                if not isinstance(payload, dict):
+                    raise ValueError("Request body must be a JSON object.")
+                job = service.submit(payload)
+            except (ValueError, json.JSONDecodeError) as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            except RuntimeError as e:
+                self._send_json(409, {"error": str(e)})
+                return
+            self._send_json(202, service.summary(job))
+
+        def do_GET(self):
+            parts = [part for part in self.path.split("/") if part]
+            if parts == ["jobs"]:
+                self._send_json(200, [service.summary(job) for job in list(service.jobs.values())])
+            elif len(parts) == 2 and parts[0] == "jobs":
+                job = self._find_job(parts[1])
+                if job is not None:
+                    self._send_json(200, service.summary(job))
+            elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+                job = self._find_job(parts[1])
+                if job is not None:
+                    self._stream(job)
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def _stream(self, job):
+            # Newline-delimited JSON, one event per line, until the job finishes
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            for event in service.stream_events(job):
+                self.wfile.write(json.dumps(event).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+        def log_message(self, format, *args):
+            print(f"[service] {self.address_string()} {format % args}")
+
+    return JobRequestHandler
+
+
+def serve(host="127.0.0.1", port=8080, workers=None):
+    """Run the job API until interrupted."""
+    service = JobService(workers)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"Manuscript service listening on http://{host}:{port} with {service.workers} workers.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down manuscript service...")
+    finally:
+        server.server_close()
+        service.shutdown()
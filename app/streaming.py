@@ -0,0 +1,181 @@
+import asyncio
+import os
+from docx import Document
+from docx_handler import (
+    append_section_lines,
+    iter_sections,
+    merge_groups_and_save,
+    process_section,
+    save_combined_document,
+    styled_section,
+)
+from formats import default_output_format, input_format
+from journal import file_hash, open_journal, text_hash
+from section_store import open_section_store
+from style_channel import (
+    SIDE_CHANNEL_FILENAME,
+    StyleRestorer,
+    new_side_channel,
+    save_side_channel,
+)
+
+
+async def stream_manuscript(
+    filename,
+    section_size,
+    system_message,
+    user_prefix,
+    action,
+    diff_mode=False,
+    prepass=False,
+    concurrency=4,
+    progress=None,
+    keep_styles=False,
+    template=False,
+    output_format=None,
+    prompt_hash=None,
+):
+    """Split, process and build a manuscript as overlapping stages.
+
+    Sections are dispatched to the API as soon as the reader seals them, up to
+    `concurrency` requests at a time, and completed sections are appended to the
+    output documents strictly in order while later sections are still in flight.
+    With template, or an EPUB or Markdown output_format, the in-order builder
+    is skipped and the output is written once every section is done.
+    """
+    if concurrency < 1:
+        raise ValueError("Concurrency must be at least 1.")
+    output_format = output_format or default_output_format(filename)
+    keep_styles = keep_styles and input_format(filename) == "docx"
+    build_at_end = template or output_format != "docx"
+    file = os.path.splitext(os.path.basename(filename))[0]
+    tmp_dir = f"./tmp/{file}"
+    if not os.path.exists(tmp_dir):
+        os.makedirs(tmp_dir)
+    # A side-channel left by an earlier keep_styles split no longer matches these sections
+    if not keep_styles and os.path.exists(os.path.join(tmp_dir, SIDE_CHANNEL_FILENAME)):
+        os.remove(os.path.join(tmp_dir, SIDE_CHANNEL_FILENAME))
+
+    store = open_section_store(tmp_dir)
+    journal = open_journal(tmp_dir, store)
+    section_hashes = []
+    semaphore = asyncio.Semaphore(concurrency)
+    pending = {}
+    edited_doc = Document()
+    original_doc = Document()
+    edited_h1 = original_h1 = False
+    side_channel = new_side_channel() if keep_styles else None
+    restorer = StyleRestorer(side_channel, filename) if keep_styles else None
+    next_number = 1
+    completed_sections = 0
+
+    def emit(event, **details):
+        if progress is not None:
+            progress({"event": event, **details})
+
+    async def process(number, total_so_far):
+        async with semaphore:
+            return await asyncio.to_thread(
+                process_section,
+                store,
+                number,
+                completed_sections,
+                total_so_far,
+                system_message,
+                user_prefix,
+                diff_mode,
+                prepass,
+                journal,
+                prompt_hash,
+            )
+
+    async def drain(wait_for_all):
+        """Append every finished section at the head of the queue to the documents."""
+        nonlocal next_number, edited_h1, original_h1, completed_sections
+        while next_number in pending:
+            task = pending[next_number]
+            if not task.done():
+                if not wait_for_all:
+                    return
+                await asyncio.wait([task])
+            corrected_text = task.result()
+            del pending[next_number]
+            if build_at_end:
+                completed_sections += 1
+                emit("section", section=next_number, completed=completed_sections)
+                next_number += 1
+                continue
+            old_lines = store.read(next_number, "old").splitlines()
+            new_lines = corrected_text.splitlines()
+            original_h1 = append_section_lines(
+                original_doc,
+                old_lines,
+                original_h1,
+                restorer,
+                next_number if restorer else None,
+            )
+            edited_h1 = append_section_lines(
+                edited_doc,
+                new_lines,
+                edited_h1,
+                restorer,
+                styled_section(store, next_number, new_lines) if restorer else None,
+            )
+            completed_sections += 1
+            emit("section", section=next_number, completed=completed_sections)
+            next_number += 1
+
+    try:
+        sections = iter_sections(filename, section_size, side_channel)
+        number = 0
+        while True:
+            # Parse the next section off the event loop so requests keep flowing
+            section = await asyncio.to_thread(next, sections, None)
+            if section is None:
+                break
+            number += 1
+            section_text = "\n".join(section)
+            section_hashes.append(text_hash(section_text))
+
+            unchanged = store.exists(number, "old") and store.read(number, "old") == section_text
+            if (
+                unchanged
+                and store.exists(number, "new")
+                and journal.is_valid(number, section_text, store.read(number, "new"), prompt_hash)
+            ):
+                print(f"[stream_manuscript] .new section already exists for section: {number}")
+                pending[number] = asyncio.get_running_loop().create_future()
+                pending[number].set_result(store.read(number, "new"))
+            else:
+                if not unchanged:
+                    store.write(number, "old", section_text)
+                pending[number] = asyncio.create_task(process(number, number))
+
+            await drain(wait_for_all=False)
+
+        print(f"{filename}: Split into {number} sections.")
+        if side_channel is not None:
+            save_side_channel(tmp_dir, side_channel)
+        for kind in ["old", "new"]:
+            for stale in store.numbers(kind):
+                if stale > number:
+                    store.delete(stale, kind)
+        journal.record_split(file_hash(filename), section_size, keep_styles, section_hashes)
+        emit("split", sections=number)
+        await drain(wait_for_all=True)
+        emit("processed")
+
+        if build_at_end:
+            await asyncio.to_thread(
+                merge_groups_and_save, filename, action, template, output_format
+            )
+        else:
+            await asyncio.to_thread(
+                save_combined_document, edited_doc, filename, f"{action.upper()}_"
+            )
+            await asyncio.to_thread(save_combined_document, original_doc, filename, "ORIGINAL_")
+        emit("built", action=action.upper())
+    finally:
+        for task in pending.values():
+            task.cancel()
+        store.close()
@@ -0,0 +1,168 @@
+import copy
+import json
+import os
+import re
+from collections import Counter
+
+from docx import Document
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.oxml import parse_xml
+from docx.oxml.ns import qn
+from lxml import etree
+
+SIDE_CHANNEL_FILENAME = "styles.json"
+
+# Placeholder tags the model sees: <r12>text</r12> for runs with extra formatting
+# and <x3/> for opaque runs such as images and footnote references.
+RUN_TAG_REGEX = re.compile(r"r(\d+)")
+OBJECT_TAG_REGEX = re.compile(r"x(\d+)\s*/")
+
+# Run properties already carried inline as <b> and <i>
+INLINE_PROPERTY_TAGS = {qn("w:b"), qn("w:bCs"), qn("w:i"), qn("w:iCs")}
+OBJECT_TAGS = {
+    qn("w:drawing"),
+    qn("w:pict"),
+    qn("w:object"),
+    qn("w:footnoteReference"),
+    qn("w:endnoteReference"),
+}
+RELATIONSHIP_ATTRIBUTES = {qn("r:embed"), qn("r:link"), qn("r:id")}
+NOTE_PARTS = {qn("w:footnoteReference"): RT.FOOTNOTES, qn("w:endnoteReference"): RT.ENDNOTES}
+
+
+def serialize(element):
+    """Serialize an XML element compactly for the side-channel."""
+    return etree.tostring(element, encoding="unicode")
+
+
+def new_side_channel():
+    """Return an empty side-channel for paragraph and run properties."""
+    return {"paragraphs": {}, "runs": {}, "objects": {}}
+
+
+def is_object_run(run):
+    """Return True if a run holds an image, embedded object or note reference."""
+    return any(child.tag in OBJECT_TAGS for child in run._r.iter())
+
+
+def extra_run_properties(run):
+    """Serialize a run's properties other than bold/italic, or None if it has none."""
+    rPr = run._r.rPr
+    if rPr is None:
+        return None
+    extra = copy.deepcopy(rPr)
+    for child in list(extra):
+        if child.tag in INLINE_PROPERTY_TAGS:
+            extra.remove(child)
+    return serialize(extra) if len(extra) else None
+
+
+def base_run_properties(runs):
+    """Return the most common extra run properties among a paragraph's text runs."""
+    counts = Counter(extra_run_properties(run) for run in runs if not is_object_run(run))
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def record(side_channel, kind, xml):
+    """Store a run's XML in the side-channel and return its placeholder number."""
+    entries = side_channel[kind]
+    number = str(len(side_channel["runs"]) + len(side_channel["objects"]) + 1)
+    entries[number] = xml
+    return number
+
+
+def save_side_channel(tmp_dir, side_channel):
+    """Write the side-channel next to the section files."""
+    path = os.path.join(tmp_dir, SIDE_CHANNEL_FILENAME)
+    with open(path, "w", encoding="utf-8") as side_channel_file:
+        json.dump(side_channel, side_channel_file)
+
+
+def load_side_channel(tmp_dir):
+    """Load a manuscript's side-channel, or None if it was split without one."""
+    path = os.path.join(tmp_dir, SIDE_CHANNEL_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as side_channel_file:
+        return json.load(side_channel_file)
+
+
+class StyleRestorer:
+    """Re-applies side-channel properties to paragraphs and runs of a built document.
+
+    Images and note references point at parts of the source package, so the
+    source DOCX is opened lazily the first time an object has to be restored,
+    unless the document being written is itself the opened source.
+    """
+
+    def __init__(self, side_channel, source_filename, source_document=None):
+        self.side_channel = side_channel
+        self.source_filename = source_filename
+        self._source = source_document
+
+    def _source_part(self):
+        if self._source is None:
+            self._source = Document(self.source_filename)
+        return self._source.part
+
+    def paragraph_properties(self, key):
+        return self.side_channel["paragraphs"].get(key, {})
+
+    def apply_paragraph(self, para, key):
+        """Replace a paragraph's properties with the source paragraph's."""
+        pPr_xml = self.paragraph_properties(key).get("pPr")
+        if not pPr_xml:
+            return
+        pPr = parse_xml(pPr_xml)
+        # Section breaks reference headers and footers of the source document
+        for sectPr in pPr.findall(qn("w:sectPr")):
+            pPr.remove(sectPr)
+        existing = para._p.pPr
+        if existing is not None:
+            para._p.remove(existing)
+        para._p.insert(0, pPr)
+
+    def apply_run(self, run, number=None, key=None):
+        """Apply a placeholder's run properties, or the paragraph's base properties."""
+        if number is not None:
+            rPr_xml = self.side_channel["runs"].get(number)
+        else:
+            rPr_xml = self.paragraph_properties(key).get("rPr")
+        if not rPr_xml:
+            return
+        bold, italic = run.bold, run.italic
+        existing = run._r.rPr
+        if existing is not None:
+            run._r.remove(existing)
+        run._r.insert(0, parse_xml(rPr_xml))
+        run.bold, run.italic = bold, italic
+
+    def add_object(self, para, number):
+        """Append a cloned opaque run, relinking its parts into the target document."""
+        run_xml = self.side_channel["objects"].get(number)
+        if not run_xml:
+            return
+        r = parse_xml(run_xml)
+        target_part = para.part
+        source_part = self._source_part()
+
+        for element in r.iter():
+            for attribute in RELATIONSHIP_ATTRIBUTES & set(element.attrib):
+                rel = source_part.rels.get(element.get(attribute))
+                if rel is None:
+                    continue
+                if rel.is_external:
+                    rId = target_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+                else:
+                    rId = target_part.relate_to(rel.target_part, rel.reltype)
+                element.set(attribute, rId)
+
+            # Note references need the source's footnotes or endnotes part
+            reltype = NOTE_PARTS.get(element.tag)
+            if reltype is not None and target_part is not source_part:
+                try:
+                    target_part.part_related_by(reltype)
+                except KeyError:
+                    target_part.relate_to(source_part.part_related_by(reltype), reltype)
+
+        para._p.append(r)
@@ -0,0 +1,147 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+from section_store import open_section_store
+
+# Every line of a section is one tagged paragraph
+LINE_REGEX = re.compile(r"<(title|center|p|h[1-9])>.*</\1>", re.DOTALL)
+INLINE_TAG_REGEX = re.compile(r"<(/?)(b|i|r\d+)>")
+PLACEHOLDER_REGEX = re.compile(r"<(r\d+)>|<(x\d+)\s*/>")
+FENCE_REGEX = re.compile(r"```")
+WORD_REGEX = re.compile(r"\w+")
+
+# Allowed ratio of .new to .old length; translations may grow or shrink more
+LENGTH_RATIO_LIMITS = {"edit": (0.8, 1.25), "translate": (0.5, 2.0)}
+DEFAULT_MIN_SIMILARITY = 0.6  # Word-level similarity an edit must keep
+
+
+def _lines(text):
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def inline_tags_balanced(line):
+    """Return True if the <b>, <i> and <rN> tags in a line open and close in order."""
+    stack = []
+    for match in INLINE_TAG_REGEX.finditer(line):
+        closing, tag = match.groups()
+        if not closing:
+            stack.append(tag)
+        elif not stack or stack.pop() != tag:
+            return False
+    return not stack
+
+
+def word_similarity(old_text, new_text):
+    """Return the word-level similarity ratio of two texts, from 0.0 to 1.0."""
+    old_words = WORD_REGEX.findall(old_text.lower())
+    new_words = WORD_REGEX.findall(new_text.lower())
+    return SequenceMatcher(None, old_words, new_words, autojunk=False).ratio()
+
+
+def check_section(old_text, new_text, mode="edit", min_similarity=DEFAULT_MIN_SIMILARITY):
+    """Compare a section's .old and .new text and return a list of problems.
+
+    The checks are local and cheap: code fences or commentary lines, a changed
+    paragraph count, unbalanced inline tags, lost style placeholders, a length
+    ratio outside the mode's limits and, for edits, too little word overlap.
+    """
+    if not new_text.strip():
+        return ["empty output"]
+
+    problems = []
+    old_lines = _lines(old_text)
+    new_lines = _lines(new_text)
+
+    if FENCE_REGEX.search(new_text):
+        problems.append("code fence in output")
+    untagged = [i + 1 for i, line in enumerate(new_lines) if not LINE_REGEX.fullmatch(line)]
+    if untagged:
+        problems.append(f"untagged lines {untagged[:5]}")
+    if len(new_lines) != len(old_lines):
+        problems.append(f"paragraph count {len(old_lines)} -> {len(new_lines)}")
+
+    # Only flag tag problems the model introduced
+    unbalanced = [
+        i + 1
+        for i, line in enumerate(new_lines)
+        if not inline_tags_balanced(line)
+        and not (i < len(old_lines) and not inline_tags_balanced(old_lines[i]))
+    ]
+    if unbalanced:
+        problems.append(f"unbalanced tags on lines {unbalanced[:5]}")
+
+    old_placeholders = {"".join(m) for m in PLACEHOLDER_REGEX.findall(old_text)}
+    new_placeholders = {"".join(m) for m in PLACEHOLDER_REGEX.findall(new_text)}
+    if old_placeholders != new_placeholders:
+        missing = sorted(old_placeholders - new_placeholders)
+        extra = sorted(new_placeholders - old_placeholders)
+        problems.append(f"placeholders changed (missing {missing}, unknown {extra})")
+
+    low, high = LENGTH_RATIO_LIMITS.get(mode, LENGTH_RATIO_LIMITS["edit"])
+    ratio = len(new_text) / max(len(old_text), 1)
+    if not low <= ratio <= high:
+        problems.append(f"length ratio {ratio:.2f}")
+
+    if mode == "edit":
+        similarity = word_similarity(old_text, new_text)
+        if similarity < min_similarity:
+            problems.append(f"word similarity {similarity:.2f}")
+
+    return problems
+
+
+def _check_pair(args):
+    number, old_text, new_text, mode, min_similarity = args
+    return number, check_section(old_text, new_text, mode, min_similarity)
+
+
+def verify_sections(filename, mode="edit", workers=None):
+    """Check every processed section of a manuscript and return {number: problems}.
+
+    Sections are checked in a process pool (VERIFY_WORKERS, default one per
+    CPU) since edit distance on long sections is CPU bound. Only sections with
+    problems are returned.
+    """
+    file = os.path.splitext(os.path.basename(filename))[0]
+    tmp_dir = f"./tmp/{file}"
+    if not os.path.exists(tmp_dir):
+        raise Exception("Temporary directory not found.")
+
+    min_similarity = float(os.getenv("VERIFY_MIN_SIMILARITY", DEFAULT_MIN_SIMILARITY))
+    store = open_section_store(tmp_dir)
+    try:
+        new_numbers = set(store.numbers("new"))
+        pairs = [
+            (number, store.read(number, "old"), store.read(number, "new"), mode, min_similarity)
+            for number in store.numbers("old")
+            if number in new_numbers
+        ]
+    finally:
+        store.close()
+
+    workers = workers or int(os.getenv("VERIFY_WORKERS", 0)) or os.cpu_count() or 1
+    if workers == 1 or len(pairs) < 2:
+        results = map(_check_pair, pairs)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pairs))) as executor:
+            chunksize = max(1, len(pairs) // (workers * 4))
+            results = list(executor.map(_check_pair, pairs, chunksize=chunksize))
+
+    failures = {number: problems for number, problems in results if problems}
+    for number, problems in sorted(failures.items()):
+        print(f"[verify_sections] Section {number} failed: {'; '.join(problems)}")
+    print(f"[verify_sections] Checked {len(pairs)} sections, {len(failures)} failed.")
+    return failures
+
+
+def requeue_sections(filename, numbers):
+    """Delete the .new output of the given sections so the next run redoes them."""
+    file = os.path.splitext(os.path.basename(filename))[0]
+    store = open_section_store(f"./tmp/{file}")
+    try:
+        for number in numbers:
+            store.delete(number, "new")
+    finally:
+        store.close()
@@ -0,0 +1,100 @@
+import importlib
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+import api  # noqa: E402
+from cassette import Cassette  # noqa: E402
+
+
+@pytest.fixture
+def reload_api(monkeypatch):
+    """Reload api under the test's environment and restore it afterwards."""
+    yield lambda: importlib.reload(api)
+    monkeypatch.undo()
+    importlib.reload(api)
+
+
+def test_cassette_replays_entries_in_order_with_recorded_timing(tmp_path):
+    path = str(tmp_path / "api.jsonl")
+    recorder = Cassette(path, "record")
+    recorder.record("m", "sys", "user", 2.0, response="first")
+    recorder.record("m", "sys", "user", 4.0, response="second")
+    recorder.record("m", "sys", "other", 1.0, error="Rate limit exceeded")
+
+    player = Cassette(path, "replay", speed=2.0)
+    with patch("cassette.time.sleep") as sleep:
+        assert player.replay("m", "sys", "user") == "first"
+        assert player.replay("m", "sys", "user") == "second"
+        # The last entry repeats once a request's entries run out
+        assert player.replay("m", "sys", "user") == "second"
+        with pytest.raises(Exception, match="Rate limit exceeded"):
+            player.replay("m", "sys", "other")
+    assert [c.args[0] for c in sleep.call_args_list] == [1.0, 2.0, 2.0, 0.5]
+
+    with pytest.raises(Exception, match="No cassette entry"):
+        player.replay("m", "sys", "unknown")
+
+
+def test_cassette_injects_repeatable_failures(tmp_path):
+    path = str(tmp_path / "api.jsonl")
+    Cassette(path, "record").record("m", "sys", "user", 0.1, response="ok")
+
+    def outcomes(seed):
+        player = Cassette(path, "replay", speed=0, failure_rate=0.5, seed=seed)
+        results = []
+        for _ in range(20):
+            try:
+                results.append(player.replay("m", "sys", "user"))
+            except Exception as e:
+                results.append(str(e))
+        return results
+
+    first = outcomes(seed=7)
+    assert first == outcomes(seed=7)
+    assert "ok" in first and "Injected cassette failure" in first
+
+
+def test_api_records_then_replays_without_a_key(tmp_path, monkeypatch, reload_api):
+    path = str(tmp_path / "cassettes" / "api.jsonl")
+    monkeypatch.setenv("CASSETTE_PATH", path)
+    monkeypatch.setenv("CASSETTE_MODE", "record")
+    recording_api = reload_api()
+
+    completion = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="<p>Edited.</p>"))],
+        usage=None,
+    )
+    fake_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=lambda **kwargs: completion))
+    )
+    monkeypatch.setattr(recording_api, "client", fake_client)
+    assert recording_api.communicate_with_openai("<p>Edit.</p>", 0, 1, "sys", "Fix") == "<p>Edited.</p>"
+
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.setenv("CASSETTE_MODE", "replay")
+    monkeypatch.setenv("CASSETTE_SPEED", "0")
+    replaying_api = reload_api()
+
+    assert replaying_api.client is None
+    assert replaying_api.communicate_with_openai("<p>Edit.</p>", 0, 1, "sys", "Fix") == "<p>Edited.</p>"
+    with pytest.raises(Exception, match="No cassette entry"):
+        replaying_api.communicate_with_openai("<p>Other.</p>", 0, 1, "sys", "Fix")
+
+
+def test_missing_cassette_only_fails_replayed_requests(tmp_path, monkeypatch, reload_api):
+    monkeypatch.setenv("CASSETTE_PATH", str(tmp_path / "missing.jsonl"))
+    monkeypatch.setenv("CASSETTE_MODE", "replay")
+    monkeypatch.setenv("CASSETTE_SPEED", "0")
+    replaying_api = reload_api()
+
+    with pytest.raises(Exception, match="does not exist"):
+        replaying_api.communicate_with_openai("<p>Edit.</p>", 0, 1, "sys", "Fix")
@@ -0,0 +1,111 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from diff_edit import (  # noqa: E402
+    apply_replacements,
+    number_paragraphs,
+    parse_replacements,
+)
+from docx_handler import process_manuscript  # noqa: E402
+
+
+def test_number_paragraphs_prefixes_each_line():
+    assert number_paragraphs("<p>One</p>\n<p>Two</p>") == "0: <p>One</p>\n1: <p>Two</p>"
+
+
+def test_parse_replacements_accepts_fenced_json():
+    response = '```json\n{"edits": [{"paragraph": 1, "old": "teh", "new": "the"}]}\n```'
+    assert parse_replacements(response) == [(1, "teh", "the")]
+
+
+@pytest.mark.parametrize(
+    "response",
+    [
+        "Here are the edits you asked for.",
+        '{"edits": [{"paragraph": "1", "old": "a", "new": "b"}]}',
+        '{"edits": [{"paragraph": 0, "old": "", "new": "b"}]}',
+        '{"changes": []}',
+    ],
+)
+def test_parse_replacements_rejects_malformed_responses(response):
+    with pytest.raises(ValueError):
+        parse_replacements(response)
+
+
+def test_apply_replacements_edits_only_target_paragraph():
+    section = "<p>I saw teh cat.</p>\n<p>teh end</p>"
+    result = apply_replacements(section, [(0, "teh", "the")])
+    assert result == "<p>I saw the cat.</p>\n<p>teh end</p>"
+
+
+@pytest.mark.parametrize(
+    "replacements",
+    [
+        [(2, "teh", "the")],
+        [(0, "missing", "x")],
+        [(0, "</p>", "")],
+    ],
+)
+def test_apply_replacements_rejects_invalid_edits(replacements):
+    with pytest.raises(ValueError):
+        apply_replacements("<p>I saw teh cat.</p>\n<p>teh end</p>", replacements)
+
+
+def test_apply_replacements_rejects_ambiguous_spans():
+    with pytest.raises(ValueError, match="not unique"):
+        apply_replacements("<p>He saw the cat and the dog.</p>", [(0, "the", "a")])
+    result = apply_replacements("<p>He saw the cat and the dog.</p>", [(0, "the cat", "a cat")])
+    assert result == "<p>He saw a cat and the dog.</p>"
+
+
+def _make_section(tmp_path, name, old_text):
+    section_dir = tmp_path / "tmp" / Path(name).stem
+    section_dir.mkdir(parents=True)
+    (section_dir / "1-section.old").write_text(old_text)
+    return section_dir
+
+
+def test_process_manuscript_diff_mode_applies_edits_locally(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    section_dir = _make_section(tmp_path, "diff.docx", "<p>I saw teh cat.</p>")
+
+    response = '{"edits": [{"paragraph": 0, "old": "teh", "new": "the"}]}'
+    with patch("docx_handler.communicate_with_openai", return_value=response) as api:
+        result = process_manuscript(str(tmp_path / "diff.docx"), "sys", "user", diff_mode=True)
+
+    assert api.call_count == 1
+    assert api.call_args[0][0] == "0: <p>I saw teh cat.</p>"
+    assert result == ["<p>I saw the cat.</p>"]
+    assert (section_dir / "1-section.new").read_text() == "<p>I saw the cat.</p>"
+
+
+def test_process_manuscript_diff_mode_reuses_unchanged_section(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _make_section(tmp_path, "clean.docx", "<p>All good.</p>")
+
+    with patch("docx_handler.communicate_with_openai", return_value='{"edits": []}'):
+        result = process_manuscript(str(tmp_path / "clean.docx"), "sys", "user", diff_mode=True)
+
+    assert result == ["<p>All good.</p>"]
+
+
+def test_process_manuscript_diff_mode_falls_back_to_full_text(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _make_section(tmp_path, "fallback.docx", "<p>I saw teh cat.</p>")
+
+    responses = ["not json at all", "<p>I saw the cat.</p>"]
+    with patch("docx_handler.communicate_with_openai", side_effect=responses) as api:
+        result = process_manuscript(str(tmp_path / "fallback.docx"), "sys", "user", diff_mode=True)
+
+    assert api.call_count == 2
+    # The fallback request uses the caller's original prompts and raw text.
+    assert api.call_args[0] == ("<p>I saw teh cat.</p>", 0, 1, "sys", "user")
+    assert result == ["<p>I saw the cat.</p>"]
@@ -0,0 +1,166 @@
+import os
+import re
+import sys
+import zipfile
+from pathlib import Path
+from unittest.mock import patch
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import merge_groups_and_save, split_into_sections  # noqa: E402
+from formats import read_epub, read_markdown, read_text, write_epub, write_markdown  # noqa: E402
+from pipeline import run_job, validate_job  # noqa: E402
+
+LINES = [
+    "<h1>Chapter One</h1>",
+    "<p>She said <i>hello</i> & left <b>at once</b>.</p>",
+    "<center>* * *</center>",
+    "<h2>Part 2</h2>",
+    "<p>A 5*3 sum_total.</p>",
+]
+
+
+def test_read_markdown_and_text(tmp_path):
+    markdown = tmp_path / "book.md"
+    markdown.write_text(
+        "# Chapter One\n\nShe said *hello*\nand **left**.\n\n<center>* * *</center>\n"
+        "## Part 2\nText right under a heading with a \\* star.\n"
+    )
+    assert list(read_markdown(str(markdown))) == [
+        "<h1>Chapter One</h1>",
+        "<p>She said <i>hello</i> and <b>left</b>.</p>",
+        "<center>* * *</center>",
+        "<h2>Part 2</h2>",
+        "<p>Text right under a heading with a * star.</p>",
+    ]
+
+    text = tmp_path / "book.txt"
+    text.write_text("First line\nwrapped.\n\n\nSecond paragraph.\n")
+    assert list(read_text(str(text))) == ["<p>First line wrapped.</p>", "<p>Second paragraph.</p>"]
+
+
+def test_markdown_and_epub_writers_round_trip(tmp_path):
+    markdown = tmp_path / "out.md"
+    write_markdown(LINES, str(markdown))
+    assert list(read_markdown(str(markdown))) == LINES
+
+    epub = tmp_path / "out.epub"
+    write_epub(LINES + ["<h1>Chapter Two</h1>", "<p>More.</p>"], str(epub), "Book")
+    assert list(read_epub(str(epub))) == LINES + ["<h1>Chapter Two</h1>", "<p>More.</p>"]
+
+
+def test_validate_job_accepts_supported_formats(tmp_path):
+    for name in ["book.epub", "book.md", "book.txt", "book.docx"]:
+        (tmp_path / name).write_text("")
+        assert validate_job("edit", str(tmp_path / name), 512) is None
+    (tmp_path / "book.pdf").write_text("")
+    assert "must be one of" in validate_job("edit", str(tmp_path / "book.pdf"), 512)
+
+
+def test_markdown_job_skips_docx_and_writes_markdown(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    source = tmp_path / "story.md"
+    source.write_text("# One\n\nThe cat sat.\n\nThe dog ran.\n")
+
+    fake_openai = lambda text, *args: text.replace("The", "A")  # noqa: E731
+    with patch("docx_handler.communicate_with_openai", side_effect=fake_openai), patch(
+        "docx_handler.Document", side_effect=AssertionError("python-docx used")
+    ):
+        run_job("edit", str(source), 4)
+
+    output = tmp_path / "output"
+    assert sorted(os.listdir(output)) == ["EDIT_story.md", "ORIGINAL_story.md"]
+    assert (output / "EDIT_story.md").read_text() == "# One\n\nA cat sat.\n\nA dog ran.\n"
+
+
+def test_docx_input_can_build_epub(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    doc = Document()
+    doc.add_heading("One", level=1)
+    doc.add_paragraph("It's a \"test\".")
+    source = tmp_path / "novel.docx"
+    doc.save(str(source))
+    split_into_sections(str(source), 100)
+
+    merge_groups_and_save(str(source), "build", output_format="epub")
+
+    lines = list(read_epub(str(tmp_path / "output" / "ORIGINAL_novel.epub")))
+    assert lines == ["<h1>One</h1>", "<p>It’s a “test”.</p>"]
+
+
+def test_literal_angle_brackets_and_ampersands_survive_every_format(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    source = tmp_path / "maths.txt"
+    source.write_text("A < B and C > D here.\n\nFish & chips <3 <b>bold</b>.\n")
+    split_into_sections(str(source), 100)
+
+    for output_format in ["docx", "markdown", "epub"]:
+        merge_groups_and_save(str(source), "build", output_format=output_format)
+
+    doc = Document(str(tmp_path / "output" / "ORIGINAL_maths.docx"))
+    assert [para.text for para in doc.paragraphs] == [
+        "A < B and C > D here.",
+        "Fish & chips <3 bold.",
+    ]
+    assert [run.bold for run in doc.paragraphs[1].runs] == [None, True, None]
+    assert list(read_markdown(str(tmp_path / "output" / "ORIGINAL_maths.md"))) == [
+        "<p>A < B and C > D here.</p>",
+        "<p>Fish & chips <3 <b>bold</b>.</p>",
+    ]
+    assert list(read_epub(str(tmp_path / "output" / "ORIGINAL_maths.epub"))) == [
+        "<p>A < B and C > D here.</p>",
+        "<p>Fish & chips <3 <b>bold</b>.</p>",
+    ]
+
+
+def test_quotes_are_curled_inside_the_line_tags(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    source = tmp_path / "dialogue.md"
+    source.write_text("\"Hello,\" she said.\n\nHe said *\"odd\"* twice.\n")
+    split_into_sections(str(source), 100)
+
+    merge_groups_and_save(str(source), "build")
+
+    assert (tmp_path / "output" / "ORIGINAL_dialogue.md").read_text() == (
+        "“Hello,” she said.\n\nHe said *“odd”* twice.\n"
+    )
+
+
+def test_stray_model_tags_are_dropped_not_printed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    source = tmp_path / "stray.md"
+    source.write_text("She was tired.\n")
+    split_into_sections(str(source), 100)
+    (tmp_path / "tmp" / "stray" / "1-section.new").write_text(
+        "<p>She was <em>so</em> tired.<br>Next <u>line</u>, A < B.</p>"
+    )
+
+    for output_format in ["docx", "markdown", "epub"]:
+        merge_groups_and_save(str(source), "edit", output_format=output_format)
+
+    expected = "She was so tired.Next line, A < B."
+    assert Document(str(tmp_path / "output" / "EDIT_stray.docx")).paragraphs[0].text == expected
+    assert (tmp_path / "output" / "EDIT_stray.md").read_text() == expected + "\n"
+    assert list(read_epub(str(tmp_path / "output" / "EDIT_stray.epub"))) == [f"<p>{expected}</p>"]
+
+
+def test_epub_clamps_deep_headings_and_records_modification_time(tmp_path):
+    epub = tmp_path / "deep.epub"
+    write_epub(["<h1>One</h1>", "<h8>Deep</h8>", "<p>Text.</p>"], str(epub), "Book")
+
+    with zipfile.ZipFile(epub) as archive:
+        chapter = archive.read("OEBPS/chapter-1.xhtml").decode("utf-8")
+        package = archive.read("OEBPS/content.opf").decode("utf-8")
+    assert "<h6>Deep</h6>" in chapter and "<h8>" not in chapter
+    assert re.search(
+        r'<meta property="dcterms:modified">\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ</meta>', package
+    )
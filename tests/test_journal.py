@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import process_manuscript, split_into_sections  # noqa: E402
+from journal import JOURNAL_FILENAME, Journal  # noqa: E402
+from prompts import compile_prompt  # noqa: E402
+
+
+def _make_docx(tmp_path, paragraphs):
+    doc = Document()
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    path = tmp_path / "journaled.docx"
+    doc.save(str(path))
+    return str(path)
+
+
+def _run(docx_path, prompt_name="edit"):
+    calls = []
+    compiled = compile_prompt(prompt_name)
+
+    def fake_openai(text, *args):
+        calls.append(text)
+        return text.replace("word", "WORD")
+
+    with patch("docx_handler.communicate_with_openai", side_effect=fake_openai):
+        process_manuscript(
+            docx_path,
+            compiled.system_message,
+            compiled.user_prefix,
+            prompt_hash=compiled.hash,
+        )
+    return calls
+
+
+def test_rerun_reprocesses_only_torn_or_unjournaled_sections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    docx_path = _make_docx(tmp_path, ["one word", "two word", "three word"])
+    split_into_sections(docx_path, 2)
+    assert len(_run(docx_path)) == 3
+
+    section_dir = tmp_path / "tmp" / "journaled"
+    # A .new section truncated by a crash no longer matches its commit record
+    (section_dir / "2-section.new").write_text("<p>two WO")
+    assert _run(docx_path) == ["<p>two word</p>"]
+    assert (section_dir / "2-section.new").read_text() == "<p>two WORD</p>"
+
+    # A different prompt invalidates every committed section
+    assert len(_run(docx_path, "edit-nonfiction")) == 3
+    assert not list(section_dir.glob("*.tmp"))
+
+
+def test_resplit_keeps_unchanged_sections_and_drops_stale_ones(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    docx_path = _make_docx(tmp_path, ["one word", "two word", "three word"])
+    split_into_sections(docx_path, 2)
+    _run(docx_path)
+    section_dir = tmp_path / "tmp" / "journaled"
+    first_mtime = os.stat(section_dir / "1-section.old").st_mtime_ns
+
+    # The second paragraph is edited and the third removed from the source
+    _make_docx(tmp_path, ["one word", "two changed word"])
+    split_into_sections(docx_path, 3)
+
+    assert os.stat(section_dir / "1-section.old").st_mtime_ns == first_mtime
+    assert not (section_dir / "3-section.old").exists()
+    assert not (section_dir / "3-section.new").exists()
+    assert _run(docx_path) == ["<p>two changed word</p>"]
+
+    journal = Journal(str(section_dir))
+    assert sorted(journal.commits) == [1, 2]
+    assert journal.header["section_size"] == 3
+
+
+def test_journal_ignores_torn_last_line(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.commit(1, "old", "new", "job")
+    with open(tmp_path / JOURNAL_FILENAME, "a") as journal_file:
+        journal_file.write('{"type": "commit", "section": 2, "ol')
+
+    reopened = Journal(str(tmp_path))
+    assert list(reopened.commits) == [1]
+    assert reopened.is_valid(1, "old", "new", "job")
+    assert not reopened.is_valid(1, "old", "other", "job")
+
+    # The next record starts on its own line instead of extending the torn one
+    reopened.commit(3, "old", "new", "job")
+    assert sorted(Journal(str(tmp_path)).commits) == [1, 3]
+    lines = (tmp_path / JOURNAL_FILENAME).read_text().splitlines()
+    assert json.loads(lines[-1])["section"] == 3
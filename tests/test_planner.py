@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from pipeline import validate_job  # noqa: E402
+from planner import (  # noqa: E402
+    PlanOption,
+    estimate_seconds,
+    fit_latency,
+    plan_job,
+    recommend,
+    recommended_command,
+)
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_fit_latency_uses_log_or_defaults(tmp_path):
+    log_path = tmp_path / "latency.jsonl"
+    assert fit_latency(str(log_path)) == (1.0, 0.02)
+
+    entries = [{"output_tokens": tokens, "seconds": 2 + 0.01 * tokens} for tokens in [100, 300, 500]]
+    log_path.write_text("\n".join(json.dumps(e) for e in entries) + "\nnot json\n")
+    base, per_token = fit_latency(str(log_path))
+    assert round(base, 6) == 2.0
+    assert round(per_token, 6) == 0.01
+
+
+def test_estimate_seconds_respects_concurrency_and_rate_limits():
+    latencies = [10.0] * 8
+    assert estimate_seconds(latencies, 1, 0, None, None) == 80.0
+    assert estimate_seconds(latencies, 8, 0, None, None) == 10.0
+    # 8 requests at 6 per minute take at least 80 seconds
+    assert estimate_seconds(latencies, 8, 0, 6, None) == 80.0
+    assert estimate_seconds(latencies, 8, 1000, None, 500) == 120.0
+
+
+def test_plan_job_compares_section_sizes(tmp_path, monkeypatch):
+    monkeypatch.setenv("PLAN_INPUT_PRICE", "1000000")
+    monkeypatch.setenv("PLAN_OUTPUT_PRICE", "0")
+    monkeypatch.delenv("PLAN_RPM", raising=False)
+    monkeypatch.delenv("PLAN_TPM", raising=False)
+    doc = Document()
+    for _ in range(8):
+        doc.add_paragraph(" ".join(["word"] * 9))
+    docx_path = tmp_path / "plan.docx"
+    doc.save(str(docx_path))
+
+    # The manuscript is parsed once, whatever the number of sizes compared
+    with patch("docx_handler.Document", side_effect=Document) as parse:
+        options = plan_job(
+            str(docx_path),
+            "one two",
+            "three",
+            section_sizes=[10, 40],
+            concurrency_levels=[1, 4],
+            count_tokens=count_words,
+            latency=(1.0, 0.1),
+        )
+    assert parse.call_count == 1
+
+    by_key = {(o.section_size, o.concurrency): o for o in options}
+    # Each line is "<p>word ... word</p>", 9 tokens by whitespace
+    assert by_key[(10, 1)].requests == 8
+    assert by_key[(40, 1)].requests == 2
+    assert by_key[(10, 1)].output_tokens == by_key[(40, 1)].output_tokens == 72
+    # Every request repeats the prompt, so smaller sections send more input
+    assert by_key[(10, 1)].input_tokens == 72 + 8 * (3 + 12)
+    assert by_key[(10, 1)].cost > by_key[(40, 1)].cost
+    assert by_key[(10, 4)].seconds < by_key[(10, 1)].seconds
+
+
+def test_recommend_prefers_cheap_options_near_the_fastest_and_avoids_truncation():
+    def option(size, concurrency, cost, seconds, truncated=0):
+        return PlanOption(size, concurrency, 1, 1, 1, truncated, cost, seconds)
+
+    options = [
+        option(256, 8, 2.0, 100),
+        option(1024, 4, 1.0, 105),
+        option(1024, 8, 1.0, 104),
+        option(2048, 8, 0.5, 100, truncated=1),
+    ]
+    assert recommend(options) == options[1]
+
+
+def test_recommended_command_follows_the_planned_prompt():
+    option = PlanOption(512, 4, 10, 0, 0, 0, 0.0, 0.0)
+    assert recommended_command("my book.docx", "edit", "English", option) == (
+        "edit 'my book.docx' 512 --stream --concurrency 4"
+    )
+    serial = option._replace(concurrency=1)
+    assert recommended_command("book.md", "translate-localized", "French", serial) == (
+        "translate book.md French 512 --prompt translate-localized"
+    )
+
+
+def test_plan_sizes_are_validated(tmp_path):
+    (tmp_path / "book.docx").write_text("")
+    path = str(tmp_path / "book.docx")
+    assert validate_job("plan", path, [256, 4096]) is None
+    assert "greater than 0" in validate_job("plan", path, [256, 0])
+    assert "should not exceed" in validate_job("plan", path, [5000])
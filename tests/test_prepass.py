@@ -0,0 +1,81 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import process_manuscript  # noqa: E402
+from prepass import prepass_section  # noqa: E402
+
+
+def test_prepass_fixes_mechanical_issues_outside_tags():
+    section = "<p>She went to the the store  today . . . and -- back.</p>\n<p>He had had enough.</p>"
+    text, fixes, needs_model = prepass_section(section)
+
+    assert text == "<p>She went to the the store today... and — back.</p>\n<p>He had had enough.</p>"
+    assert fixes["double_spaces"] == 1
+    assert fixes["ellipses"] == 2
+    assert fixes["dashes"] == 1
+    # Without a word list every section is still sent to the model
+    assert needs_model is True
+
+
+def test_prepass_leaves_markup_untouched():
+    section = "<p><b>Bold</b> <b>bold</b> <i>text</i></p>"
+    text, fixes, _ = prepass_section(section)
+    assert text == section
+    assert sum(fixes.values()) == 0
+
+
+def test_prepass_dictionary_and_wordlist(tmp_path, monkeypatch):
+    dictionary = tmp_path / "dictionary.txt"
+    dictionary.write_text("# misspelling correction\nteh the\nrecieve receive\n")
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("the\ncat\nwill\nreceive\nit\n")
+    monkeypatch.setenv("PREPASS_DICTIONARY", str(dictionary))
+    monkeypatch.setenv("PREPASS_WORDLIST", str(wordlist))
+
+    text, fixes, needs_model = prepass_section("<p>Teh cat will recieve it.</p>")
+    assert text == "<p>The cat will receive it.</p>"
+    assert fixes["spelling"] == 2
+    assert needs_model is False
+
+    _, _, needs_model = prepass_section("<p>The dog will receive it.</p>")
+    assert needs_model is True
+
+
+def test_prepass_leaves_repeats_and_dash_spacing_to_the_author(tmp_path, monkeypatch):
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("ha\nknock\nbye\nnow\nthe\nend\n")
+    monkeypatch.setenv("PREPASS_WORDLIST", str(wordlist))
+
+    section = "<p>Ha ha. Knock knock. Bye bye. Now now.</p>\n<p>The end—the end -- the end.</p>"
+    text, fixes, needs_model = prepass_section(section)
+    assert text == section.replace("--", "—")
+    assert fixes["dashes"] == 1
+    # Repeats are never collapsed locally, so the model must review them
+    assert needs_model is True
+
+    _, _, needs_model = prepass_section("<p>The end — the end.</p>")
+    assert needs_model is False
+
+
+def test_process_manuscript_prepass_skips_clean_sections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    wordlist = tmp_path / "words.txt"
+    wordlist.write_text("all\ngood\nhere\n")
+    monkeypatch.setenv("PREPASS_WORDLIST", str(wordlist))
+
+    section_dir = tmp_path / "tmp" / "prepass"
+    section_dir.mkdir(parents=True)
+    (section_dir / "1-section.old").write_text("<p>All  good here.</p>")
+    (section_dir / "2-section.old").write_text("<p>Needs a reviewer.</p>")
+
+    with patch("docx_handler.communicate_with_openai", return_value="<p>Reviewed.</p>") as api:
+        result = process_manuscript(str(tmp_path / "prepass.docx"), "sys", "user", prepass=True)
+
+    assert api.call_count == 1
+    assert result == ["<p>All good here.</p>", "<p>Reviewed.</p>"]
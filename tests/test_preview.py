@@ -0,0 +1,103 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import (  # noqa: E402
+    build_preview,
+    chapter_index,
+    process_manuscript,
+    split_into_sections,
+)
+from pipeline import parse_range  # noqa: E402
+from section_store import DirectoryStore  # noqa: E402
+
+
+def _write_sections(tmp_path):
+    section_dir = tmp_path / "tmp" / "book"
+    section_dir.mkdir(parents=True)
+    olds = [
+        "<p>Foreword.</p>\n<h1>One</h1>\n<p>One a.</p>",
+        "<p>One b.</p>\n<h1>Two</h1>\n<p>Two a.</p>",
+        "<p>Two b.</p>",
+        "<h1>Three</h1>\n<p>Three a.</p>",
+    ]
+    for number, text in enumerate(olds, start=1):
+        (section_dir / f"{number}-section.old").write_text(text)
+    # Only the second section has been processed so far
+    (section_dir / "2-section.new").write_text(
+        "<p>One b, edited.</p>\n<h1>Two</h1>\n<p>Two a, edited.</p>"
+    )
+    return section_dir
+
+
+def test_chapter_index_maps_h1_positions_to_sections(tmp_path):
+    store = DirectoryStore(str(_write_sections(tmp_path)))
+    starts, spans = chapter_index(store)
+    assert starts == {1: 0, 2: 1, 3: 2, 4: 2}
+    assert spans == {0: [1, 1], 1: [1, 2], 2: [2, 3], 3: [4, 4]}
+
+
+def test_build_preview_of_a_chapter_mixes_new_and_old_sections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    _write_sections(tmp_path)
+
+    path = build_preview("book.docx", chapters=(2, 2))
+
+    assert Path(path).name == "PREVIEW_ch2-2_book.docx"
+    preview = Document(path)
+    assert [p.text for p in preview.paragraphs] == ["Two", "Two a, edited.", "Two b."]
+    assert preview.paragraphs[0].style.name == "Heading 1"
+
+
+def test_build_preview_of_sections_and_invalid_ranges(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    _write_sections(tmp_path)
+
+    preview = Document(build_preview("book.docx", sections=(3, 4)))
+    assert [p.text for p in preview.paragraphs] == ["Two b.", "Three", "Three a."]
+
+    with pytest.raises(ValueError):
+        build_preview("book.docx", chapters=(2, 7))
+    with pytest.raises(ValueError):
+        build_preview("book.docx", sections=(9, 9))
+
+
+def test_parse_range():
+    assert parse_range("3-5") == (3, 5)
+    assert parse_range("12") == (12, 12)
+    for text in ["5-3", "a", "-2", "1-x"]:
+        with pytest.raises(ValueError):
+            parse_range(text)
+
+
+def test_build_preview_ignores_new_sections_left_stale_by_a_resplit(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    doc = Document()
+    doc.add_heading("One", level=1)
+    doc.add_paragraph("Alpha beta gamma.")
+    doc.add_paragraph("Delta epsilon zeta.")
+    doc.save(str(tmp_path / "resplit.docx"))
+
+    split_into_sections("resplit.docx", 100)
+    with patch("docx_handler.communicate_with_openai", side_effect=lambda text, *a: text.upper()):
+        process_manuscript("resplit.docx", "sys", "user")
+
+    # Section 1 now holds fewer paragraphs, so its .new no longer matches
+    split_into_sections("resplit.docx", 4)
+    preview = Document(build_preview("resplit.docx", sections=(1, 2)))
+    assert [p.text for p in preview.paragraphs] == [
+        "One",
+        "Alpha beta gamma.",
+        "Delta epsilon zeta.",
+    ]
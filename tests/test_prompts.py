@@ -0,0 +1,96 @@
+import json
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from pipeline import run_job  # noqa: E402
+from prompts import compile_prompt, list_prompts  # noqa: E402
+
+
+def test_builtin_prompt_library_compiles():
+    assert {"edit", "translate"} <= set(list_prompts())
+    edit = compile_prompt("edit")
+    assert edit.system_message.startswith("As a renowned romance book editor")
+    assert edit.version == 1
+
+    translate = compile_prompt("translate", language="French")
+    assert "from English to French" in translate.user_prefix
+
+
+def test_prompt_hash_is_stable_and_tracks_rendered_text():
+    assert compile_prompt("edit").hash == compile_prompt("edit").hash
+    assert (
+        compile_prompt("translate", language="French").hash
+        != compile_prompt("translate", language="German").hash
+    )
+
+
+def test_custom_prompt_dir(tmp_path, monkeypatch):
+    prompt = {"name": "poetry", "version": 3, "system": "Edit poems.", "user_prefix": "Fix:"}
+    (tmp_path / "poetry.json").write_text(json.dumps(prompt))
+    monkeypatch.setenv("PROMPT_DIR", str(tmp_path))
+
+    assert list_prompts() == ["poetry"]
+    compiled = compile_prompt("poetry")
+    assert (compiled.system_message, compiled.user_prefix, compiled.version) == (
+        "Edit poems.",
+        "Fix:",
+        3,
+    )
+
+    prompt["version"] = 4
+    (tmp_path / "poetry.json").write_text(json.dumps(prompt))
+    os.utime(tmp_path / "poetry.json", (1, 1))
+    assert compile_prompt("poetry").version == 4
+
+
+def test_literal_braces_in_prompts(tmp_path, monkeypatch):
+    prompt = {
+        "name": "json",
+        "version": 1,
+        "system": 'Reply like {"edits": [{"old": "a", "new": "b"}]} or {}.',
+        "user_prefix": "Edit into {language}:",
+    }
+    (tmp_path / "json.json").write_text(json.dumps(prompt))
+    monkeypatch.setenv("PROMPT_DIR", str(tmp_path))
+
+    compiled = compile_prompt("json", language="French")
+    assert compiled.system_message == prompt["system"]
+    assert compiled.user_prefix == "Edit into French:"
+
+
+@pytest.mark.parametrize(
+    "name, params, message",
+    [
+        ("no-such-prompt", {}, "Unknown prompt"),
+        ("translate", {}, "needs a value"),
+        ("../prompts/edit", {}, "Invalid prompt name"),
+        ("/etc/passwd", {}, "Invalid prompt name"),
+    ],
+)
+def test_prompt_errors(name, params, message):
+    with pytest.raises(ValueError, match=message):
+        compile_prompt(name, **params)
+
+
+def test_run_job_uses_named_prompt(tmp_path):
+    events = []
+    with patch("pipeline.split_into_sections", return_value=[["<p>x</p>"]]), patch(
+        "pipeline.process_manuscript"
+    ) as process, patch("pipeline.merge_groups_and_save"):
+        run_job(
+            "edit", str(tmp_path / "book.docx"), 256, prompt="edit-nonfiction", progress=events.append
+        )
+
+    expected = compile_prompt("edit-nonfiction")
+    assert process.call_args[0][1:3] == (expected.system_message, expected.user_prefix)
+    # The journal keys sections on the compiled prompt's own hash
+    assert process.call_args[0][6] == expected.hash
+    assert events[0] == {"event": "prompt", "name": "edit-nonfiction", "version": 1, "hash": expected.hash}
@@ -0,0 +1,103 @@
+import os
+import sys
+from pathlib import Path
+
+from docx import Document
+from docx.oxml.ns import qn
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import chapter_index  # noqa: E402
+from report import (  # noqa: E402
+    diff_manuscript,
+    diff_section,
+    diff_words,
+    report_manuscript,
+)
+from section_store import DirectoryStore  # noqa: E402
+
+
+def test_diff_words_keeps_whitespace_and_marks_changed_words():
+    segments = diff_words("I saw teh cat.", "I saw the black cat.")
+    assert segments == [
+        ("equal", "I saw "),
+        ("delete", "teh"),
+        ("insert", "the black"),
+        ("equal", " cat."),
+    ]
+    assert "".join(text for op, text in segments if op != "insert") == "I saw teh cat."
+    assert "".join(text for op, text in segments if op != "delete") == "I saw the black cat."
+
+
+def test_diff_section_aligns_inserted_and_dropped_paragraphs():
+    old = "<h1>One</h1>\n<p>Kept.</p>\n<p>Dropped.</p>\n<p>Also <i>kept</i>.</p>"
+    new = "<h1>One</h1>\n<p>Kept.</p>\n<p>Also <i>kept</i>.</p>\n<p>Added.</p>"
+    paragraphs = diff_section((1, old, new))
+
+    assert [(p.tag, p.old, p.new) for p in paragraphs] == [
+        ("h1", "One", "One"),
+        ("p", "Kept.", "Kept."),
+        ("p", "Dropped.", ""),
+        ("p", "Also kept.", "Also kept."),
+        ("p", "", "Added."),
+    ]
+    assert [p.segments is None for p in paragraphs] == [True, True, False, True, False]
+
+
+def _write_sections(tmp_path, stem, sections):
+    section_dir = tmp_path / "tmp" / stem
+    section_dir.mkdir(parents=True)
+    for number, (old, new) in enumerate(sections, start=1):
+        (section_dir / f"{number}-section.old").write_text(old)
+        if new is not None:
+            (section_dir / f"{number}-section.new").write_text(new)
+
+
+def test_diff_manuscript_summarizes_change_density_per_chapter(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _write_sections(
+        tmp_path,
+        "book",
+        [
+            ("<title>Book</title>\n<p>A foreword here.</p>\n<h1>One</h1>\n<p>one two three four</p>",
+             "<title>Book</title>\n<p>A foreword here.</p>\n<h1>One</h1>\n<p>one two three five</p>"),
+            ("<h1>Two</h1>\n<p>Untouched words.</p>", None),
+        ],
+    )
+
+    manuscript_diff = diff_manuscript("book.docx", workers=2)
+
+    # Chapters are counted the same way as build --chapters: <title> is front matter
+    assert [c.title for c in manuscript_diff.chapters] == ["Front matter", "One", "Two"]
+    starts, spans = chapter_index(DirectoryStore(str(tmp_path / "tmp" / "book")))
+    assert sorted(spans) == [0, 1, 2]
+    one = manuscript_diff.chapters[1]
+    assert (one.paragraphs, one.changed_paragraphs, one.words, one.changed_words) == (2, 1, 5, 2)
+    assert one.density == 2 / 5
+    assert manuscript_diff.chapters[2].changed_words == 0
+
+
+def test_report_manuscript_writes_html_and_tracked_docx(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    _write_sections(
+        tmp_path,
+        "book",
+        [("<h1>One</h1>\n<p>I saw teh cat & dog.</p>", "<h1>One</h1>\n<p>I saw the cat & dog <3.</p>")],
+    )
+
+    html_path, docx_path = report_manuscript("book.docx", html_report=True, tracked_docx=True)
+
+    report = Path(html_path).read_text()
+    assert "<del>teh</del><ins>the</ins>" in report
+    assert "cat &amp; dog" in report
+    assert "<ins> &lt;3</ins>" in report
+
+    tracked = Document(docx_path)
+    body = tracked.element.body
+    assert [el.text for el in body.iter(qn("w:delText"))] == ["teh"]
+    inserted = [t.text for ins in body.iter(qn("w:ins")) for t in ins.iter(qn("w:t"))]
+    assert inserted == ["the", " <3"]
+    assert tracked.paragraphs[0].style.name == "Heading 1"
@@ -0,0 +1,138 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import (  # noqa: E402
+    merge_groups_and_save,
+    process_manuscript,
+    split_into_sections,
+)
+from journal import JOURNAL_FILENAME  # noqa: E402
+from section_store import (  # noqa: E402
+    PACK_FILENAME,
+    DirectoryStore,
+    PackedStore,
+    open_section_store,
+)
+
+
+def test_packed_store_round_trip_and_latest_write_wins(tmp_path):
+    store = PackedStore(str(tmp_path))
+    store.write(2, "old", "<p>Two</p>")
+    store.write(1, "old", "<p>One – é</p>")
+    store.write(1, "new", "<p>First</p>")
+    store.write(1, "new", "<p>Second</p>")
+    store.close()
+
+    reopened = PackedStore(str(tmp_path))
+    assert reopened.numbers("old") == [1, 2]
+    assert reopened.numbers("new") == [1]
+    assert reopened.read(1, "old") == "<p>One – é</p>"
+    assert reopened.read(1, "new") == "<p>Second</p>"
+    assert not reopened.exists(2, "new")
+    with pytest.raises(FileNotFoundError):
+        reopened.read(2, "new")
+    reopened.close()
+
+
+def test_packed_store_truncates_torn_tail_record(tmp_path):
+    store = PackedStore(str(tmp_path))
+    store.write(1, "old", "<p>Complete</p>")
+    store.write(2, "old", "<p>Torn by a crash</p>")
+    store.close()
+
+    pack_path = tmp_path / PACK_FILENAME
+    with open(pack_path, "r+b") as pack_file:
+        pack_file.truncate(os.path.getsize(pack_path) - 5)
+
+    reopened = PackedStore(str(tmp_path))
+    assert reopened.numbers("old") == [1]
+    reopened.write(3, "old", "<p>After recovery</p>")
+    reopened.close()
+
+    recovered = PackedStore(str(tmp_path))
+    assert recovered.numbers("old") == [1, 3]
+    assert recovered.read(3, "old") == "<p>After recovery</p>"
+    recovered.close()
+
+
+def test_store_delete_survives_reopen(tmp_path):
+    for store_class in [DirectoryStore, PackedStore]:
+        section_dir = tmp_path / store_class.__name__
+        section_dir.mkdir()
+        store = store_class(str(section_dir))
+        store.write(1, "old", "<p>Old</p>")
+        store.write(1, "new", "<p>Bad</p>")
+        store.delete(1, "new")
+        store.close()
+
+        reopened = store_class(str(section_dir))
+        assert reopened.numbers("new") == []
+        assert reopened.read(1, "old") == "<p>Old</p>"
+        reopened.write(1, "new", "<p>Good</p>")
+        reopened.close()
+        assert store_class(str(section_dir)).read(1, "new") == "<p>Good</p>"
+
+
+def test_packed_store_export_and_import(tmp_path):
+    store = PackedStore(str(tmp_path))
+    store.write(1, "old", "<p>Old</p>")
+    store.write(1, "new", "<p>New</p>")
+    assert store.export_files() == 2
+    store.close()
+
+    assert (tmp_path / "1-section.old").read_text() == "<p>Old</p>"
+    assert (tmp_path / "1-section.new").read_text() == "<p>New</p>"
+
+    os.remove(tmp_path / PACK_FILENAME)
+    imported = PackedStore(str(tmp_path))
+    assert imported.import_files() == 2
+    assert imported.read(1, "new") == "<p>New</p>"
+    imported.close()
+
+
+def test_open_section_store_follows_env_and_existing_pack(tmp_path, monkeypatch):
+    monkeypatch.delenv("SECTION_STORE", raising=False)
+    assert isinstance(open_section_store(str(tmp_path)), DirectoryStore)
+
+    monkeypatch.setenv("SECTION_STORE", "packed")
+    open_section_store(str(tmp_path)).close()
+
+    monkeypatch.delenv("SECTION_STORE")
+    store = open_section_store(str(tmp_path))
+    assert isinstance(store, PackedStore)
+    store.close()
+
+
+def test_pipeline_with_packed_store_writes_no_section_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SECTION_STORE", "packed")
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+
+    doc = Document()
+    doc.add_paragraph(" ".join(["alpha"] * 10))
+    doc.add_paragraph(" ".join(["beta"] * 10))
+    docx_path = tmp_path / "packed.docx"
+    doc.save(str(docx_path))
+
+    split_into_sections(str(docx_path), section_size=15)
+    fake_openai = lambda text, *args: text.replace("a", "A")  # noqa: E731
+    with patch("docx_handler.communicate_with_openai", side_effect=fake_openai):
+        process_manuscript(str(docx_path), "sys", "user")
+    merge_groups_and_save(str(docx_path), "edit")
+
+    section_dir = tmp_path / "tmp" / "packed"
+    assert sorted(os.listdir(section_dir)) == [JOURNAL_FILENAME, PACK_FILENAME]
+    edited = Document(str(tmp_path / "output" / "EDIT_packed.docx"))
+    assert [p.text for p in edited.paragraphs] == [
+        " ".join(["AlphA"] * 10),
+        " ".join(["betA"] * 10),
+    ]
@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from service import JobService, make_handler  # noqa: E402
+
+
+@pytest.fixture
+def running_service():
+    service = JobService(workers=1)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield service, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    service.shutdown()
+
+
+def _post(url, body):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.status, json.loads(response.read())
+
+
+def _make_docx(tmp_path):
+    doc = Document()
+    doc.add_paragraph("Hello there.")
+    path = tmp_path / "service.docx"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_job_runs_and_streams_progress_events(tmp_path, running_service):
+    service, base_url = running_service
+    docx_path = _make_docx(tmp_path)
+    release = threading.Event()
+
+    def fake_run_job(command, filename, sections, progress=None, **kwargs):
+        release.wait(5)
+        progress({"event": "split", "sections": 1})
+        progress({"event": "section", "section": 1, "completed": 1, "total": 1})
+
+    with patch("service.run_job", side_effect=fake_run_job):
+        status, job = _post(
+            f"{base_url}/jobs", {"command": "edit", "filename": docx_path, "sections": 256}
+        )
+        assert status == 202
+        assert job["state"] in ("queued", "running")
+
+        release.set()
+        with urllib.request.urlopen(f"{base_url}/jobs/{job['id']}/events") as response:
+            events = [json.loads(line)["event"] for line in response if line.strip()]
+
+    assert events == ["queued", "started", "split", "section", "done"]
+    with urllib.request.urlopen(f"{base_url}/jobs/{job['id']}") as response:
+        assert json.loads(response.read())["state"] == "done"
+
+
+def test_failed_job_reports_error(tmp_path, running_service):
+    service, base_url = running_service
+    docx_path = _make_docx(tmp_path)
+
+    with patch("service.run_job", side_effect=Exception("boom")):
+        _, job = _post(
+            f"{base_url}/jobs", {"command": "edit", "filename": docx_path, "sections": 256}
+        )
+        events = list(service.stream_events(service.jobs[job["id"]], timeout=5))
+
+    assert events[-1]["event"] == "failed"
+    assert service.summary(service.jobs[job["id"]])["error"] == "boom"
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"command": "build", "filename": "x.docx", "sections": 256},
+        {"command": "edit", "filename": "missing.docx", "sections": 256},
+        {"command": "translate", "filename": "x.docx", "sections": 256},
+        {"command": "edit", "filename": "x.docx", "sections": 256, "concurrency": 0},
+        {"command": "edit", "filename": "x.docx", "sections": 256, "concurrency": "4"},
+        {"command": "edit", "filename": "x.docx", "sections": True},
+        {"command": "edit", "filename": "x.docx", "sections": 256, "prompt": "../prompts/edit"},
+    ],
+)
+def test_invalid_job_requests_are_rejected(tmp_path, running_service, body):
+    service, base_url = running_service
+    if body["filename"] == "x.docx":
+        body = {**body, "filename": _make_docx(tmp_path)}
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        _post(f"{base_url}/jobs", body)
+    assert excinfo.value.code == 400
+    # A rejected job never holds the manuscript name
+    assert service.jobs == {}
+
+
+def test_duplicate_manuscript_job_is_rejected_while_running(tmp_path, running_service):
+    service, base_url = running_service
+    docx_path = _make_docx(tmp_path)
+    release = threading.Event()
+
+    with patch("service.run_job", side_effect=lambda *args, **kwargs: release.wait(5)):
+        _, job = _post(
+            f"{base_url}/jobs", {"command": "edit", "filename": docx_path, "sections": 256}
+        )
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            _post(f"{base_url}/jobs", {"command": "edit", "filename": docx_path, "sections": 256})
+        release.set()
+        list(service.stream_events(service.jobs[job["id"]], timeout=5))
+
+    assert excinfo.value.code == 409
+
+
+def test_only_the_most_recent_finished_jobs_are_retained(tmp_path):
+    service = JobService(workers=1, retained_jobs=2)
+    docx_path = _make_docx(tmp_path)
+    ids = []
+    with patch("service.run_job"):
+        for _ in range(4):
+            job = service.submit({"command": "edit", "filename": docx_path, "sections": 256})
+            list(service.stream_events(job, timeout=5))
+            ids.append(job["id"])
+    service.shutdown()
+
+    assert list(service.jobs) == ids[2:]
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import merge_groups_and_save, split_into_sections  # noqa: E402
+from pipeline import validate_job  # noqa: E402
+from streaming import stream_manuscript  # noqa: E402
+from style_channel import SIDE_CHANNEL_FILENAME  # noqa: E402
+
+
+def _make_docx(tmp_path, paragraphs):
+    doc = Document()
+    doc.add_heading("Chapter One", level=1)
+    for text in paragraphs:
+        doc.add_paragraph(text)
+    path = tmp_path / "stream.docx"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_stream_manuscript_builds_in_order_despite_out_of_order_completion(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    docx_path = _make_docx(tmp_path, [f"Paragraph {i} text." for i in range(1, 6)])
+
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_openai(section_text, completed, total, system_message, user_prefix):
+        with lock:
+            in_flight.append(section_text)
+            peak.append(len(in_flight))
+        # Earlier sections take longer, so later ones finish first
+        time.sleep(0.05 if "Chapter" in section_text or "1" in section_text else 0.01)
+        with lock:
+            in_flight.remove(section_text)
+        return section_text.replace("text", "TEXT")
+
+    events = []
+    with patch("docx_handler.communicate_with_openai", side_effect=fake_openai):
+        asyncio.run(
+            stream_manuscript(
+                docx_path, 4, "sys", "user", "edit", concurrency=3, progress=events.append
+            )
+        )
+
+    assert max(peak) > 1
+    assert max(peak) <= 3
+    edited = Document(str(tmp_path / "output" / "EDIT_stream.docx"))
+    assert [p.text for p in edited.paragraphs] == ["Chapter One"] + [
+        f"Paragraph {i} TEXT." for i in range(1, 6)
+    ]
+    original = Document(str(tmp_path / "output" / "ORIGINAL_stream.docx"))
+    assert [p.text for p in original.paragraphs][-1] == "Paragraph 5 text."
+    completed = [event["section"] for event in events if event["event"] == "section"]
+    assert completed == sorted(completed)
+    assert events[-1] == {"event": "built", "action": "EDIT"}
+
+
+def test_stream_manuscript_reuses_matching_new_sections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    docx_path = _make_docx(tmp_path, ["Only paragraph here."])
+
+    section_dir = tmp_path / "tmp" / "stream"
+    section_dir.mkdir(parents=True)
+    (section_dir / "1-section.old").write_text(
+        "<h1>Chapter One</h1>\n<p>Only paragraph here.</p>"
+    )
+    (section_dir / "1-section.new").write_text("<h1>Chapter One</h1>\n<p>Already done.</p>")
+
+    with patch("docx_handler.communicate_with_openai") as api:
+        asyncio.run(stream_manuscript(docx_path, 100, "sys", "user", "edit"))
+
+    api.assert_not_called()
+    edited = Document(str(tmp_path / "output" / "EDIT_stream.docx"))
+    assert [p.text for p in edited.paragraphs] == ["Chapter One", "Already done."]
+
+
+def test_zero_concurrency_is_rejected_instead_of_hanging(tmp_path):
+    docx_path = _make_docx(tmp_path, ["One."])
+    assert validate_job("edit", docx_path, 256, concurrency=0) == "Concurrency must be at least 1."
+    assert validate_job("edit", docx_path, 256, concurrency=1) is None
+
+    with pytest.raises(ValueError):
+        asyncio.run(stream_manuscript(docx_path, 256, "sys", "user", "edit", concurrency=0))
+
+
+def test_stream_without_keep_styles_removes_stale_side_channel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    doc = Document()
+    doc.add_heading("Chapter One", level=1)
+    doc.add_paragraph("A quoted passage.", style="Quote")
+    docx_path = str(tmp_path / "stream.docx")
+    doc.save(docx_path)
+    split_into_sections(docx_path, 100, keep_styles=True)
+
+    # An intro paragraph shifts every line the side-channel was recorded for
+    doc = Document(docx_path)
+    doc.paragraphs[0].insert_paragraph_before("A new intro.")
+    doc.save(docx_path)
+    with patch("docx_handler.communicate_with_openai", side_effect=lambda text, *args: text):
+        asyncio.run(stream_manuscript(docx_path, 100, "sys", "user", "edit"))
+
+    assert not (tmp_path / "tmp" / "stream" / SIDE_CHANNEL_FILENAME).exists()
+    merge_groups_and_save(docx_path, "build")
+    built = Document(str(tmp_path / "output" / "BUILD_stream.docx"))
+    assert [p.style.name for p in built.paragraphs[:2]] == ["Normal", "Heading 1"]
@@ -0,0 +1,128 @@
+import io
+import os
+import struct
+import sys
+import zlib
+from pathlib import Path
+
+from docx import Document
+from docx.shared import Inches, Pt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import (  # noqa: E402
+    merge_groups_and_save,
+    process_html_fragments,
+    split_into_sections,
+)
+from style_channel import SIDE_CHANNEL_FILENAME, load_side_channel  # noqa: E402
+
+
+def _png_bytes():
+    """Return a valid 1x1 PNG."""
+
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(b"\x00\xff\x00\x00"))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _make_styled_docx(tmp_path):
+    doc = Document()
+    doc.add_heading("Chapter One", level=1)
+
+    para = doc.add_paragraph("Plain start, ")
+    underlined = para.add_run("underlined")
+    underlined.underline = True
+    para.add_run(" and ")
+    caps = para.add_run("small caps")
+    caps.font.small_caps = True
+    caps.bold = True
+
+    quote = doc.add_paragraph("A quoted passage.", style="Quote")
+    quote.paragraph_format.left_indent = Inches(1)
+
+    fonted = doc.add_paragraph()
+    fonted.add_run("Every run in a big font.").font.size = Pt(20)
+
+    doc.add_paragraph().add_run().add_picture(io.BytesIO(_png_bytes()), width=Inches(1))
+
+    path = tmp_path / "styled.docx"
+    doc.save(str(path))
+    return str(path)
+
+
+def test_process_html_fragments_keeps_placeholders():
+    fragments = process_html_fragments("a <r3>b <b>c</b></r3><x4/>d")
+    assert fragments == [
+        ("a ", set()),
+        ("b ", {"r3"}),
+        ("c", {"r3", "b"}),
+        ("", {"x4"}),
+        ("d", set()),
+    ]
+
+
+def test_split_with_keep_styles_uses_compact_placeholders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    docx_path = _make_styled_docx(tmp_path)
+
+    sections = split_into_sections(docx_path, 1000, keep_styles=True)
+    lines = sections[0]
+
+    assert lines[1] == "<p>Plain start, <r1>underlined</r1> and <r2><b>small caps</b></r2></p>"
+    assert lines[2] == "<p>A quoted passage.</p>"
+    # A font shared by every run is stored as the paragraph's base, not inline
+    assert lines[3] == "<p>Every run in a big font.</p>"
+    assert lines[4] == "<p><x3/></p>"
+
+    side_channel = load_side_channel(str(tmp_path / "tmp" / "styled"))
+    assert set(side_channel["runs"]) == {"1", "2"}
+    assert set(side_channel["objects"]) == {"3"}
+    assert side_channel["paragraphs"]["1:3"]["rPr"]
+
+
+def test_merge_restores_side_channel_formatting(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    docx_path = _make_styled_docx(tmp_path)
+    split_into_sections(docx_path, 1000, keep_styles=True)
+
+    section_dir = tmp_path / "tmp" / "styled"
+    old_text = (section_dir / "1-section.old").read_text()
+    (section_dir / "1-section.new").write_text(old_text.replace("Plain start", "Edited start"))
+
+    merge_groups_and_save(docx_path, "edit")
+
+    edited = Document(str(tmp_path / "output" / "EDIT_styled.docx"))
+    paragraphs = edited.paragraphs
+    assert paragraphs[1].text == "Edited start, underlined and small caps"
+    runs = {run.text: run for run in paragraphs[1].runs}
+    assert runs["underlined"].underline
+    assert runs["small caps"].font.small_caps and runs["small caps"].bold
+    assert not runs[" and "].underline
+
+    assert paragraphs[2].style.name == "Quote"
+    assert paragraphs[2].paragraph_format.left_indent == Inches(1)
+    assert paragraphs[3].runs[0].font.size == Pt(20)
+    assert len(edited.inline_shapes) == 1
+
+
+def test_split_without_keep_styles_removes_stale_side_channel(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    docx_path = _make_styled_docx(tmp_path)
+
+    split_into_sections(docx_path, 1000, keep_styles=True)
+    sections = split_into_sections(docx_path, 1000)
+
+    assert not (tmp_path / "tmp" / "styled" / SIDE_CHANNEL_FILENAME).exists()
+    assert "<r1>" not in sections[0][1]
@@ -0,0 +1,121 @@
+import io
+import os
+import sys
+from pathlib import Path
+
+from docx import Document
+from docx.shared import Inches, Pt
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from docx_handler import merge_groups_and_save, split_into_sections  # noqa: E402
+from test_style_channel import _png_bytes  # noqa: E402
+
+
+def _make_source(tmp_path):
+    doc = Document()
+    doc.sections[0].header.paragraphs[0].text = "Running header"
+    doc.add_heading("Chapter One", level=1)
+
+    first = doc.add_paragraph()
+    run = first.add_run("I saw teh cat.")
+    run.font.size = Pt(14)
+    first.paragraph_format.left_indent = Inches(0.5)
+
+    picture = doc.add_paragraph()
+    picture.add_run("Look: ")
+    picture.add_run().add_picture(io.BytesIO(_png_bytes()), width=Inches(1))
+
+    doc.add_paragraph("An untouched paragraph.")
+
+    path = tmp_path / "template.docx"
+    doc.save(str(path))
+    return str(path)
+
+
+def _write_new(tmp_path, replace):
+    section_dir = tmp_path / "tmp" / "template"
+    old_text = (section_dir / "1-section.old").read_text()
+    (section_dir / "1-section.new").write_text(replace(old_text))
+
+
+def test_template_output_rewrites_only_changed_paragraphs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    docx_path = _make_source(tmp_path)
+    split_into_sections(docx_path, 1000)
+    _write_new(
+        tmp_path,
+        lambda text: text.replace("teh", "<i>the</i>").replace("Look:", "See:"),
+    )
+
+    merge_groups_and_save(docx_path, "edit", template=True)
+
+    source = Document(docx_path)
+    edited = Document(str(tmp_path / "output" / "EDIT_template.docx"))
+    assert edited.sections[0].header.paragraphs[0].text == "Running header"
+
+    changed = edited.paragraphs[1]
+    assert changed.text == "I saw the cat."
+    assert changed.paragraph_format.left_indent == Inches(0.5)
+    assert all(run.font.size == Pt(14) for run in changed.runs)
+    assert [run.text for run in changed.runs if run.italic] == ["the"]
+
+    # The image run stays in place after the rewritten text
+    assert edited.paragraphs[2].text == "See: "
+    assert len(edited.inline_shapes) == 1
+
+    # Unchanged paragraphs keep their original XML
+    assert edited.paragraphs[0]._p.xml == source.paragraphs[0]._p.xml
+    assert edited.paragraphs[3]._p.xml == source.paragraphs[3]._p.xml
+
+    original = tmp_path / "output" / "ORIGINAL_template.docx"
+    assert original.read_bytes() == Path(docx_path).read_bytes()
+
+
+def test_template_output_falls_back_when_paragraph_count_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    docx_path = _make_source(tmp_path)
+    split_into_sections(docx_path, 1000)
+    _write_new(tmp_path, lambda text: text + "\n<p>An extra paragraph.</p>")
+
+    merge_groups_and_save(docx_path, "edit", template=True)
+
+    edited = Document(str(tmp_path / "output" / "EDIT_template.docx"))
+    assert edited.paragraphs[-1].text == "An extra paragraph."
+    assert edited.sections[0].header.paragraphs[0].text == ""
+
+
+def test_template_output_with_keep_styles_restores_placeholders(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    docx_path = _make_source(tmp_path)
+    split_into_sections(docx_path, 1000, keep_styles=True)
+    _write_new(tmp_path, lambda text: text.replace("Look:", "See:"))
+
+    merge_groups_and_save(docx_path, "edit", template=True)
+
+    edited = Document(str(tmp_path / "output" / "EDIT_template.docx"))
+    assert edited.paragraphs[2].text == "See: "
+    assert len(edited.inline_shapes) == 1
+    assert len(edited.part.package.image_parts) == 1
+
+
+def test_template_output_keeps_the_source_quote_style(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    doc = Document()
+    doc.add_paragraph('"Hi," she said.')
+    doc.add_paragraph('"Go," he said teh end.')
+    docx_path = str(tmp_path / "template.docx")
+    doc.save(docx_path)
+    split_into_sections(docx_path, 1000)
+    _write_new(tmp_path, lambda text: text.replace("teh", "the"))
+
+    merge_groups_and_save(docx_path, "edit", template=True)
+
+    edited = Document(str(tmp_path / "output" / "EDIT_template.docx"))
+    assert [p.text for p in edited.paragraphs] == ['"Hi," she said.', '"Go," he said the end.']
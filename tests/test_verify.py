@@ -0,0 +1,89 @@
+import os
+import sys
+from pathlib import Path
+from unittest.mock import patch
+
+from docx import Document
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "app"))
+
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+
+from pipeline import run_job  # noqa: E402
+from verify import check_section, inline_tags_balanced, verify_sections  # noqa: E402
+
+OLD = "<h1>Chapter One</h1>\n<p>She walked <i>slowly</i> into the quiet room.</p>\n<p>Nobody spoke.</p>"
+
+
+def test_check_section_accepts_light_edit():
+    new = OLD.replace("quiet", "silent")
+    assert check_section(OLD, new) == []
+
+
+def test_check_section_flags_dropped_paragraph_fence_and_commentary():
+    new = "```html\n<h1>Chapter One</h1>\n<p>She walked slowly into the quiet room.</p>\n```"
+    problems = check_section(OLD, new)
+    assert "code fence in output" in problems
+    assert any(p.startswith("untagged lines") for p in problems)
+    assert any(p.startswith("paragraph count") for p in problems)
+
+    commentary = OLD + "\nHere is the edited text."
+    assert any(p.startswith("untagged lines [4]") for p in check_section(OLD, commentary))
+
+
+def test_check_section_flags_unbalanced_tags_and_lost_placeholders():
+    assert inline_tags_balanced("<b>a <i>b</i></b>")
+    assert not inline_tags_balanced("<b>a <i>b</b></i>")
+
+    broken = OLD.replace("slowly</i>", "slowly")
+    assert any(p.startswith("unbalanced tags") for p in check_section(OLD, broken))
+
+    styled = "<p>See <r1>this</r1><x2/></p>"
+    problems = check_section(styled, "<p>See this</p>")
+    assert any(p.startswith("placeholders changed") for p in problems)
+
+
+def test_check_section_length_and_similarity_depend_on_mode():
+    rewritten = (
+        "<h1>Chapitre Un</h1>\n<p>Elle entra <i>lentement</i> dans la piece calme.</p>\n"
+        "<p>Personne ne parla.</p>"
+    )
+    assert any(p.startswith("word similarity") for p in check_section(OLD, rewritten))
+    assert check_section(OLD, rewritten, mode="translate") == []
+    assert check_section(OLD, OLD + OLD, mode="translate") != []
+
+
+def test_run_job_with_verify_requeues_failing_sections(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OUTPUT_DIR", str(tmp_path / "output"))
+    monkeypatch.setenv("VERIFY_WORKERS", "2")
+
+    doc = Document()
+    doc.add_paragraph("The first section of the book.")
+    doc.add_paragraph("The second section of the book.")
+    docx_path = tmp_path / "verify.docx"
+    doc.save(str(docx_path))
+
+    calls = []
+
+    def fake_openai(text, *args):
+        calls.append(text)
+        # The first answer for the second section drops into commentary
+        if "second" in text and len(calls) == 2:
+            return "```html\n" + text + "\n```"
+        return text.replace("book", "novel")
+
+    events = []
+    with patch("docx_handler.communicate_with_openai", side_effect=fake_openai):
+        run_job("edit", str(docx_path), 6, progress=events.append, verify=True)
+
+    assert len(calls) == 3
+    verified = [e["failed"] for e in events if e["event"] == "verified"]
+    assert verified == [[2], []]
+    assert verify_sections(str(docx_path)) == {}
+
+    edited = Document(str(tmp_path / "output" / "EDIT_verify.docx"))
+    assert [p.text for p in edited.paragraphs] == [
+        "The first section of the novel.",
+        "The second section of the novel.",
+    ]